@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from concurrency_control import AIMDConcurrencyController
+from tunecaster_charts_scraper import TuneCasterCompleteScraper
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def live_descendants_cpu(root_pid):
+    # utime + stime of every live descendant plus the reaped children of each
+    # (cutime + cstime), read from /proc; 0.0 where /proc is unavailable
+    parents, times = {}, {}
+    try:
+        ticks = os.sysconf('SC_CLK_TCK')
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat', 'r') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            parents.setdefault(int(fields[1]), []).append(int(entry))
+            times[int(entry)] = sum(int(value) for value in fields[11:15]) / ticks
+    except (OSError, ValueError):
+        return 0.0
+    total, stack = 0.0, list(parents.get(root_pid, []))
+    while stack:
+        pid = stack.pop()
+        total += times.get(pid, 0.0)
+        stack.extend(parents.get(pid, []))
+    return total
+
+
+def cpu_seconds():
+    # The whole process tree: Chromium and the Playwright driver do most of
+    # the work, so children that have exited (RUSAGE_CHILDREN) and children
+    # still running both count
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total + live_descendants_cpu(os.getpid())
+
+
+async def run_setting(base_url, concurrency, max_pages, settle_ms, aimd_max):
+    with tempfile.TemporaryDirectory() as data_dir:
+        scraper = TuneCasterCompleteScraper(base_url=base_url, data_dir=data_dir)
+        scraper.discovery_delay = 0
+        scraper.request_delay = 0
+        scraper.page_settle_ms = settle_ms
+
+        cpu_start = cpu_seconds()
+        wall_start = time.perf_counter()
+        await scraper.discover_all_chart_urls()
+        discovery_seconds = time.perf_counter() - wall_start
+
+        work = [(url, 'rock') for url in scraper.rock_urls] + [(url, 'pop') for url in scraper.pop_urls]
+        if max_pages:
+            work = work[:max_pages]
+
+        latencies = []
+        failures = 0
+        scrape_single_chart = scraper.scrape_single_chart
+
+        async def timed_scrape(url, chart_type, outcome=None):
+            nonlocal failures
+            started = time.perf_counter()
+            chart_data = await scrape_single_chart(url, chart_type, outcome)
+            latencies.append(time.perf_counter() - started)
+            if not chart_data:
+                failures += 1
+            return chart_data
+
+        scraper.scrape_single_chart = timed_scrape
+        scrape_start = time.perf_counter()
+
+        if concurrency == 'aimd':
+            scraper.concurrency = AIMDConcurrencyController(min_limit=1, max_limit=aimd_max)
+            rock_urls = [url for url, chart_type in work if chart_type == 'rock']
+            pop_urls = [url for url, chart_type in work if chart_type == 'pop']
+            position = await scraper.scrape_chart_phase(rock_urls, 'rock', 0, len(work))
+            await scraper.scrape_chart_phase(pop_urls, 'pop', position, len(work))
+            final_limit = scraper.concurrency.current_limit
+        else:
+            semaphore = asyncio.Semaphore(int(concurrency))
+
+            async def scrape(url, chart_type):
+                async with semaphore:
+                    await scraper.process_chart_url(url, chart_type)
+
+            await asyncio.gather(*(scrape(url, chart_type) for url, chart_type in work))
+            final_limit = int(concurrency)
+
+        scrape_seconds = time.perf_counter() - scrape_start
+
+        return {
+            'concurrency': concurrency,
+            'final_limit': final_limit,
+            'pages': len(work),
+            'fetches': len(latencies),
+            'failures': failures,
+            'discovered': len(scraper.rock_urls) + len(scraper.pop_urls),
+            'discovery_seconds': round(discovery_seconds, 3),
+            'scrape_seconds': round(scrape_seconds, 3),
+            'pages_per_second': round(len(work) / scrape_seconds, 3) if scrape_seconds else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'cpu_seconds': round(cpu_seconds() - cpu_start, 3),
+            'rss_mb': round(current_rss_mb(), 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+
+
+def run_single(args):
+    # Child mode: run one concurrency setting in a fresh process so CPU and RSS
+    # figures are not polluted by the previous settings
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = asyncio.run(run_setting(args.base_url, args.single, args.max_pages, args.settle_ms, args.aimd_max))
+    print(json.dumps(result))
+
+
+def wait_for_server(base_url, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/chart0.html", timeout=1):
+                return True
+        except Exception:
+            time.sleep(0.2)
+    return False
+
+
+def start_mock_server(args):
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_tunecaster_server.py'), 'serve',
+        '--corpus', args.corpus, '--port', str(args.port),
+        '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+        '--error-rate', str(args.error_rate), '--seed', '1',
+    ]
+    if args.rate_limit:
+        command += ['--rate-limit', str(args.rate_limit)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    if not wait_for_server(base_url):
+        process.terminate()
+        raise RuntimeError(f"Mock server did not start on {base_url}")
+    return process, base_url
+
+
+def print_table(results):
+    columns = ['concurrency', 'final_limit', 'pages', 'failures', 'pages_per_second', 'p50_ms', 'p95_ms', 'p99_ms',
+               'discovery_seconds', 'cpu_seconds', 'rss_mb', 'peak_rss_mb']
+    print(' '.join(f"{c:>17}" for c in columns))
+    for result in results:
+        print(' '.join(f"{result.get(c, ''):>17}" for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end crawl benchmark against the local mock server")
+    parser.add_argument('--corpus', default='benchmarks/corpus')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', default='1,2,4,8,aimd',
+                        help="Comma separated settings to compare; 'aimd' uses the adaptive controller")
+    parser.add_argument('--aimd-max', type=int, default=16, help="Upper bound for the adaptive controller")
+    parser.add_argument('--max-pages', type=int, default=200)
+    parser.add_argument('--settle-ms', type=int, default=0, help="Post-load wait per page (live crawl uses 3000)")
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None)
+    parser.add_argument('--output', default=None, help="Write results as JSON to this file")
+    parser.add_argument('--base-url', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--single', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args)
+        return
+
+    if not os.path.exists(os.path.join(args.corpus, 'chart0.html')):
+        from mock_tunecaster_server import build_corpus
+        build_corpus(args.corpus)
+
+    server, base_url = start_mock_server(args)
+    results = []
+    try:
+        for concurrency in [c.strip() for c in args.concurrency.split(',') if c.strip()]:
+            print(f"Running concurrency={concurrency} against {base_url}...", flush=True)
+            completed = subprocess.run(
+                [sys.executable, __file__, '--single', concurrency, '--base-url', base_url,
+                 '--max-pages', str(args.max_pages), '--settle-ms', str(args.settle_ms),
+                 '--aimd-max', str(args.aimd_max)],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(f"Setting {concurrency} failed:\n{completed.stderr}")
+                continue
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
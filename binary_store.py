@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import date
+
+import numpy as np
+
+from chart_calendar import DATE_LOG_FILE, read_date_log
+from chart_digests import read_charts
+from crawl_targets import chart_url, parse_chart_url
+
+STORE_DIR = 'data/charts_bin'
+STORE_VERSION = 1
+EPOCH = date(1970, 1, 1)
+
+CHART_TYPES = ['pop', 'rock']
+DATE_SOURCES = ['unknown', 'page', 'calendar', 'url', 'rule']
+
+# One row per chart record, sorted by (chart_type, date, rank)
+RECORD_DTYPE = np.dtype([
+    ('date', '<i4'),          # days since 1970-01-01
+    ('rank', '<i2'),
+    ('chart_type', 'u1'),     # index into CHART_TYPES
+    ('date_source', 'u1'),    # index into DATE_SOURCES
+    ('chart_id', '<u4'),      # row in charts.npy
+    ('song_id', '<u4'),       # row in songs.npy
+    ('artist_id', '<u4'),     # first credited artist, row in the artist pool
+])
+
+CHART_DTYPE = np.dtype([
+    ('date', '<i4'),
+    ('chart_type', 'u1'),
+    ('date_source', 'u1'),
+    ('code', '<u2'),          # YYWW as an integer
+    ('record_start', '<u4'),
+    ('record_count', '<u2'),
+])
+
+# A song is a distinct (title, artist credits) pair
+SONG_DTYPE = np.dtype([
+    ('title_id', '<u4'),
+    ('artist_start', '<u4'),  # slice of song_artists.npy
+    ('artist_count', '<u2'),
+])
+
+
+def to_days(value):
+    return (date.fromisoformat(value) - EPOCH).days
+
+
+def from_days(days):
+    return date.fromordinal(EPOCH.toordinal() + int(days))
+
+
+class StringPool:
+    # UTF-8 blob plus an offsets array; both memory-mapped
+
+    def __init__(self, directory, name):
+        blob_path = os.path.join(directory, f"{name}.bin")
+        # np.memmap refuses empty files
+        self.blob = np.memmap(blob_path, dtype='u1', mode='r') if os.path.getsize(blob_path) else np.zeros(0, 'u1')
+        self.offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes().decode('utf-8')
+
+
+def write_pool(directory, name, strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(os.path.join(directory, f"{name}.bin"), 'wb') as f:
+        for blob in encoded:
+            f.write(blob)
+    np.save(os.path.join(directory, f"{name}.offsets.npy"), offsets)
+
+
+def build_store(sources, output_dir=STORE_DIR, date_log=DATE_LOG_FILE):
+    charts = {}
+    for path in sources:
+        for chart in read_charts(path):
+            charts[chart['chart_info']['url']] = chart
+
+    # The CSV has no date source; the crawl's date log has it for the charts
+    # it stored, as long as the logged date is the one in the data
+    logged = read_date_log(date_log) if date_log else {}
+    for url, chart in charts.items():
+        info = chart['chart_info']
+        if 'date_source' not in info and logged.get(url, (None,))[0] == info['chart_date']:
+            info['date_source'] = logged[url][1]
+
+    titles, artists, songs = {}, {}, {}
+    song_artists = []
+    chart_rows, record_rows = [], []
+
+    def intern(pool, text):
+        index = pool.get(text)
+        if index is None:
+            index = pool[text] = len(pool)
+        return index
+
+    def chart_key(chart):
+        info = chart['chart_info']
+        return info['chart_type'], info['chart_date'], info['url']
+
+    for chart in sorted(charts.values(), key=chart_key):
+        info = chart['chart_info']
+        parsed = parse_chart_url(info['url'])
+        if not parsed:
+            continue
+        chart_type = CHART_TYPES.index(info['chart_type'])
+        date_source = DATE_SOURCES.index(info.get('date_source', 'unknown'))
+        chart_days = to_days(info['chart_date'])
+        records = sorted(chart['records'], key=lambda r: int(r['rank']))
+
+        chart_id = len(chart_rows)
+        chart_rows.append((chart_days, chart_type, date_source, int(parsed[1]), len(record_rows), len(records)))
+        for record in records:
+            credits = record.get('artist') or []
+            if isinstance(credits, str):
+                credits = json.loads(credits) if credits.startswith('[') else [credits]
+            artist_ids = tuple(intern(artists, a) for a in credits)
+            title_id = intern(titles, record['title'])
+            song_key = (title_id, artist_ids)
+            song_id = songs.get(song_key)
+            if song_id is None:
+                song_id = songs[song_key] = len(songs)
+                song_artists.extend(artist_ids)
+            first_artist = artist_ids[0] if artist_ids else np.iinfo('<u4').max
+            record_rows.append((to_days(record.get('chart_date') or info['chart_date']), int(record['rank']),
+                                chart_type, date_source, chart_id, song_id, first_artist))
+
+    song_rows = []
+    position = 0
+    for (title_id, artist_ids), song_id in sorted(songs.items(), key=lambda item: item[1]):
+        song_rows.append((title_id, position, len(artist_ids)))
+        position += len(artist_ids)
+
+    # Build next to the target and swap in, so readers never see a half-written store
+    tmp_dir = output_dir.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'records.npy'), np.array(record_rows, dtype=RECORD_DTYPE))
+    np.save(os.path.join(tmp_dir, 'charts.npy'), np.array(chart_rows, dtype=CHART_DTYPE))
+    np.save(os.path.join(tmp_dir, 'songs.npy'), np.array(song_rows, dtype=SONG_DTYPE))
+    np.save(os.path.join(tmp_dir, 'song_artists.npy'), np.array(song_artists, dtype='<u4'))
+    write_pool(tmp_dir, 'titles', titles)
+    write_pool(tmp_dir, 'artists', artists)
+    meta = {
+        'version': STORE_VERSION,
+        'chart_types': CHART_TYPES,
+        'date_sources': DATE_SOURCES,
+        'charts': len(chart_rows),
+        'records': len(record_rows),
+        'songs': len(song_rows),
+        'titles': len(titles),
+        'artists': len(artists),
+        'sources': list(sources),
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = output_dir.rstrip('/') + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(output_dir):
+        os.rename(output_dir, old_dir)
+    os.rename(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+
+class ChartStore:
+    # Zero-copy view of a store built by build_store(): every array is a
+    # read-only memory map, so processes opening the same store share pages
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported chart store version: {self.meta.get('version')}")
+        self.records = self.load('records')
+        self.charts = self.load('charts')
+        self.songs = self.load('songs')
+        self.song_artists = self.load('song_artists')
+        self.titles = StringPool(directory, 'titles')
+        self.artists = StringPool(directory, 'artists')
+
+    def load(self, name):
+        return np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.records)
+
+    def chart_type(self, index):
+        return self.meta['chart_types'][index]
+
+    def song_title(self, song_id):
+        return self.titles[self.songs[song_id]['title_id']]
+
+    def song_credits(self, song_id):
+        song = self.songs[song_id]
+        start = int(song['artist_start'])
+        return [self.artists[i] for i in self.song_artists[start:start + int(song['artist_count'])]]
+
+    def chart_url(self, chart_id, base_url='https://tunecaster.com'):
+        chart = self.charts[chart_id]
+        return chart_url(base_url, self.chart_type(chart['chart_type']), f"{int(chart['code']):04d}")
+
+    def chart_records(self, chart_id):
+        chart = self.charts[chart_id]
+        start = int(chart['record_start'])
+        return self.records[start:start + int(chart['record_count'])]
+
+    def record(self, index, base_url='https://tunecaster.com'):
+        # Materializes one row in the scraper's record format
+        row = self.records[index]
+        chart = self.charts[row['chart_id']]
+        chart_type = self.chart_type(row['chart_type'])
+        return {
+            'id': f"{chart_type}_{int(chart['code']):04d}_{int(row['rank']):03d}",
+            'chart_date': from_days(row['date']).isoformat(),
+            'rank': int(row['rank']),
+            'title': self.song_title(row['song_id']),
+            'artist': self.song_credits(row['song_id']),
+            'url': self.chart_url(row['chart_id'], base_url),
+        }
+
+    def date_range(self, start, end):
+        # Records are sorted by date within each chart type, so this is two binary searches per type
+        low, high = to_days(start), to_days(end)
+        masks = []
+        for chart_type in range(len(self.meta['chart_types'])):
+            rows = np.flatnonzero(self.records['chart_type'] == chart_type)
+            if not len(rows):
+                continue
+            dates = self.records['date'][rows[0]:rows[-1] + 1]
+            first = rows[0] + np.searchsorted(dates, low, side='left')
+            last = rows[0] + np.searchsorted(dates, high, side='right')
+            masks.append(np.arange(first, last))
+        return np.concatenate(masks) if masks else np.zeros(0, dtype=np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact memory-mapped chart store")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="Build the store from scraped chart data")
+    build.add_argument('sources', nargs='*', help="charts_data.csv, legacy JSON or NDJSON files")
+    build.add_argument('--output', default=STORE_DIR)
+    info = subparsers.add_parser('info', help="Show what a store contains")
+    info.add_argument('--store', default=STORE_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        sources = args.sources or [p for p in ['data/charts_data.json', 'data/charts_data.csv'] if os.path.exists(p)]
+        started = time.perf_counter()
+        meta = build_store(sources, args.output)
+        print(f"Built {args.output}: {meta['charts']} charts, {meta['records']} records, "
+              f"{meta['songs']} songs, {meta['artists']} artists in {time.perf_counter() - started:.1f}s")
+    else:
+        started = time.perf_counter()
+        store = ChartStore(args.store)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"Opened {args.store} in {elapsed:.1f} ms")
+        for key in ('charts', 'records', 'songs', 'titles', 'artists', 'built_at'):
+            print(f"  {key}: {store.meta[key]}")
+        if len(store):
+            first, last = store.records['date'].min(), store.records['date'].max()
+            print(f"  dates: {from_days(first)} .. {from_days(last)}")
+
+
+if __name__ == "__main__":
+    main()
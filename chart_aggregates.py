@@ -0,0 +1,395 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from search_index import normalize_text, record_artists
+
+AGGREGATES_FILE = 'data/chart_aggregates.sqlite'
+# A week at rank r is worth POINTS_BASE - r chart points, so #1 earns 100
+POINTS_BASE = 101
+
+
+def song_key(title, artists):
+    # Same song across weeks despite spelling drift; the lead artist only, so
+    # a credit gaining a 'featuring' name does not split the song
+    lead = normalize_text(artists[0]) if artists else ''
+    return f"{normalize_text(title)}|{lead}"
+
+
+class ChartAggregates:
+    # Raw weekly entries plus aggregates derived from them:
+    #   entries          one row per (chart url, rank)
+    #   entry_artists    one row per credited artist of an entry
+    #   year_end_points  chart points, weeks and peak per song per year
+    #   decade_points    the same per song per decade
+    #   artist_totals    weeks at #1, weeks charted and songs per artist
+    # Ingesting a chart recomputes only the rows of the songs and artists it
+    # touches; rebuild() recomputes everything in one vectorized pass
+
+    def __init__(self, path=AGGREGATES_FILE):
+        self.path = path
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT NOT NULL,
+                    rank INTEGER NOT NULL,
+                    chart_type TEXT NOT NULL,
+                    chart_date TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    artist TEXT NOT NULL,
+                    song_key TEXT NOT NULL,
+                    PRIMARY KEY (url, rank)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS entries_song ON entries (chart_type, song_key);
+                CREATE TABLE IF NOT EXISTS entry_artists (
+                    url TEXT NOT NULL,
+                    rank INTEGER NOT NULL,
+                    chart_type TEXT NOT NULL,
+                    artist_key TEXT NOT NULL,
+                    artist TEXT NOT NULL,
+                    PRIMARY KEY (url, rank, artist_key)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS entry_artists_key ON entry_artists (chart_type, artist_key);
+                CREATE TABLE IF NOT EXISTS year_end_points (
+                    chart_type TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    song_key TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    artist TEXT NOT NULL,
+                    points INTEGER NOT NULL,
+                    weeks INTEGER NOT NULL,
+                    peak INTEGER NOT NULL,
+                    PRIMARY KEY (chart_type, song_key, year)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS year_end_ranking ON year_end_points (chart_type, year, points DESC);
+                CREATE TABLE IF NOT EXISTS decade_points (
+                    chart_type TEXT NOT NULL,
+                    decade INTEGER NOT NULL,
+                    song_key TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    artist TEXT NOT NULL,
+                    points INTEGER NOT NULL,
+                    weeks INTEGER NOT NULL,
+                    peak INTEGER NOT NULL,
+                    PRIMARY KEY (chart_type, song_key, decade)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS decade_ranking ON decade_points (chart_type, decade, points DESC);
+                CREATE TABLE IF NOT EXISTS artist_totals (
+                    chart_type TEXT NOT NULL,
+                    artist_key TEXT NOT NULL,
+                    artist TEXT NOT NULL,
+                    weeks_at_one INTEGER NOT NULL,
+                    weeks_charted INTEGER NOT NULL,
+                    songs INTEGER NOT NULL,
+                    PRIMARY KEY (chart_type, artist_key)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS artist_number_ones ON artist_totals (chart_type, weeks_at_one DESC);
+            ''')
+        return self._db
+
+    def add_chart(self, chart_data):
+        self.add_charts([chart_data])
+
+    def add_charts(self, charts):
+        # One transaction per call; a re-scraped chart replaces its old entries
+        # and the songs and artists of both versions are recomputed
+        songs, artists = set(), set()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            for chart_data in charts:
+                info = chart_data['chart_info']
+                url, chart_type = info['url'], info['chart_type']
+                songs.update(self.db.execute("SELECT chart_type, song_key FROM entries WHERE url = ?", (url,)))
+                artists.update(self.db.execute("SELECT chart_type, artist_key FROM entry_artists WHERE url = ?", (url,)))
+                self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self.db.execute("DELETE FROM entry_artists WHERE url = ?", (url,))
+                for record in chart_data['records']:
+                    rank = int(record['rank'])
+                    credits = record_artists(record)
+                    key = song_key(record['title'], credits)
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO entries (url, rank, chart_type, chart_date, title, artist, song_key) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (url, rank, chart_type, record.get('chart_date') or info['chart_date'], record['title'],
+                         json.dumps(credits, ensure_ascii=False), key)
+                    )
+                    songs.add((chart_type, key))
+                    for artist in credits:
+                        artist_key = normalize_text(artist)
+                        if not artist_key:
+                            continue
+                        self.db.execute(
+                            "INSERT OR REPLACE INTO entry_artists (url, rank, chart_type, artist_key, artist) "
+                            "VALUES (?, ?, ?, ?, ?)", (url, rank, chart_type, artist_key, artist)
+                        )
+                        artists.add((chart_type, artist_key))
+            for chart_type, key in songs:
+                self.refresh_song(chart_type, key)
+            for chart_type, artist_key in artists:
+                self.refresh_artist(chart_type, artist_key)
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def refresh_song(self, chart_type, key):
+        # Every week of one song, rolled up per year and per decade; a song
+        # listed twice in one chart counts once, at its better rank. The title
+        # and credits shown are those of its latest week
+        rows = self.db.execute(
+            "SELECT chart_date, rank, title, artist FROM entries WHERE chart_type = ? AND song_key = ? "
+            "ORDER BY chart_date, rank", (chart_type, key)
+        ).fetchall()
+        self.db.execute("DELETE FROM year_end_points WHERE chart_type = ? AND song_key = ?", (chart_type, key))
+        self.db.execute("DELETE FROM decade_points WHERE chart_type = ? AND song_key = ?", (chart_type, key))
+        years, decades = {}, {}
+        previous_date = None
+        for chart_date, rank, title, artist in rows:
+            if chart_date == previous_date:
+                continue
+            previous_date = chart_date
+            year = int(chart_date[:4])
+            for totals, period in ((years, year), (decades, year // 10 * 10)):
+                points, weeks, peak, _, _ = totals.get(period, (0, 0, rank, None, None))
+                totals[period] = (points + POINTS_BASE - rank, weeks + 1, min(peak, rank), title, artist)
+        for table, column, totals in (('year_end_points', 'year', years), ('decade_points', 'decade', decades)):
+            self.db.executemany(
+                f"INSERT INTO {table} (chart_type, {column}, song_key, title, artist, points, weeks, peak) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(chart_type, period, key, title, artist, points, weeks, peak)
+                 for period, (points, weeks, peak, title, artist) in totals.items()]
+            )
+
+    def refresh_artist(self, chart_type, artist_key):
+        row = self.db.execute(
+            "SELECT COUNT(DISTINCT CASE WHEN e.rank = 1 THEN e.chart_date END), COUNT(DISTINCT e.chart_date), "
+            "COUNT(DISTINCT e.song_key) "
+            "FROM entry_artists a JOIN entries e ON e.url = a.url AND e.rank = a.rank "
+            "WHERE a.chart_type = ? AND a.artist_key = ?", (chart_type, artist_key)
+        ).fetchone()
+        self.db.execute("DELETE FROM artist_totals WHERE chart_type = ? AND artist_key = ?", (chart_type, artist_key))
+        if not row[1]:
+            return
+        display = self.db.execute(
+            "SELECT a.artist FROM entry_artists a JOIN entries e ON e.url = a.url AND e.rank = a.rank "
+            "WHERE a.chart_type = ? AND a.artist_key = ? ORDER BY e.chart_date DESC LIMIT 1", (chart_type, artist_key)
+        ).fetchone()[0]
+        self.db.execute(
+            "INSERT INTO artist_totals (chart_type, artist_key, artist, weeks_at_one, weeks_charted, songs) "
+            "VALUES (?, ?, ?, ?, ?, ?)", (chart_type, artist_key, display, row[0], row[1], row[2])
+        )
+
+    def load_entries(self, charts):
+        # Replaces all raw entries; the aggregates are left for rebuild()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM entry_artists")
+            for chart_data in charts:
+                info = chart_data['chart_info']
+                for record in chart_data['records']:
+                    rank = int(record['rank'])
+                    credits = record_artists(record)
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO entries (url, rank, chart_type, chart_date, title, artist, song_key) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (info['url'], rank, info['chart_type'], record.get('chart_date') or info['chart_date'],
+                         record['title'], json.dumps(credits, ensure_ascii=False), song_key(record['title'], credits))
+                    )
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO entry_artists (url, rank, chart_type, artist_key, artist) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(info['url'], rank, info['chart_type'], normalize_text(artist), artist)
+                         for artist in credits if normalize_text(artist)]
+                    )
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def rebuild(self):
+        # Full recomputation from the raw entries: keys are factorized with
+        # np.unique and every aggregate is a bincount or ufunc.at over groups.
+        # numpy is only needed here, not on the per-chart ingest path
+        import numpy as np
+
+        rows = self.db.execute("SELECT chart_type, chart_date, rank, title, artist, song_key FROM entries").fetchall()
+        credits = self.db.execute(
+            "SELECT a.chart_type, a.artist_key, a.artist, e.rank, e.song_key, e.chart_date "
+            "FROM entry_artists a JOIN entries e ON e.url = a.url AND e.rank = a.rank"
+        ).fetchall()
+
+        song_rows = []
+        if rows:
+            chart_types, dates, ranks, titles, artists, keys = (np.array(column, dtype=object) for column in zip(*rows))
+            ranks = ranks.astype(np.int64)
+            # One row per song per week, the better rank when it is listed twice
+            _, _, best = group_rows((chart_types, keys, dates), -ranks)
+            chart_types, dates, ranks, titles, artists, keys = (
+                column[best] for column in (chart_types, dates, ranks, titles, artists, keys))
+            days = dates.astype('datetime64[D]')
+            years = days.astype('datetime64[Y]').astype(np.int64) + 1970
+            for period, column in ((years, 'year'), (years // 10 * 10, 'decade')):
+                groups, first, last = group_rows((chart_types, period, keys), days)
+                song_rows.append((column, [
+                    (chart_types[i], int(period[i]), keys[i], titles[j], artists[j], int(p), int(w), int(k))
+                    for i, j, p, w, k in zip(first, last,
+                                             np.bincount(groups, weights=POINTS_BASE - ranks),
+                                             np.bincount(groups), group_min(groups, ranks))
+                ]))
+
+        artist_rows = []
+        if credits:
+            chart_types, artist_keys, names, ranks, keys, dates = (np.array(column, dtype=object) for column in zip(*credits))
+            ranks = ranks.astype(np.int64)
+            days = dates.astype('datetime64[D]')
+            groups, first, last = group_rows((chart_types, artist_keys), days)
+            _, song_of = np.unique(keys.astype(str), return_inverse=True)
+            week_of = days.astype(np.int64) - days.astype(np.int64).min()
+            artist_rows = [
+                (chart_types[i], artist_keys[i], names[j], int(ones), int(weeks), int(songs))
+                for i, j, ones, weeks, songs in zip(first, last, group_distinct(groups, week_of, ranks == 1),
+                                                    group_distinct(groups, week_of), group_distinct(groups, song_of))
+            ]
+
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            for table in ('year_end_points', 'decade_points', 'artist_totals'):
+                self.db.execute(f"DELETE FROM {table}")
+            for column, table_rows in song_rows:
+                table = 'year_end_points' if column == 'year' else 'decade_points'
+                self.db.executemany(
+                    f"INSERT INTO {table} (chart_type, {column}, song_key, title, artist, points, weeks, peak) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", table_rows
+                )
+            self.db.executemany(
+                "INSERT INTO artist_totals (chart_type, artist_key, artist, weeks_at_one, weeks_charted, songs) "
+                "VALUES (?, ?, ?, ?, ?, ?)", artist_rows
+            )
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def year_end(self, year, chart_type='pop', limit=100):
+        return self.ranking('year_end_points', 'year', year, chart_type, limit)
+
+    def decade(self, decade, chart_type='pop', limit=100):
+        return self.ranking('decade_points', 'decade', decade, chart_type, limit)
+
+    def ranking(self, table, column, period, chart_type, limit):
+        rows = self.db.execute(
+            f"SELECT title, artist, points, weeks, peak FROM {table} WHERE chart_type = ? AND {column} = ? "
+            "ORDER BY points DESC, peak, weeks DESC, title LIMIT ?", (chart_type, period, limit)
+        ).fetchall()
+        return [{'position': position, 'title': title, 'artist': json.loads(artist), 'points': points,
+                 'weeks': weeks, 'peak': peak}
+                for position, (title, artist, points, weeks, peak) in enumerate(rows, 1)]
+
+    def number_ones(self, chart_type='pop', limit=50):
+        rows = self.db.execute(
+            "SELECT artist, weeks_at_one, weeks_charted, songs FROM artist_totals "
+            "WHERE chart_type = ? AND weeks_at_one > 0 ORDER BY weeks_at_one DESC, artist LIMIT ?",
+            (chart_type, limit)
+        ).fetchall()
+        return [{'artist': artist, 'weeks_at_one': ones, 'weeks_charted': weeks, 'songs': songs}
+                for artist, ones, weeks, songs in rows]
+
+    def counts(self):
+        return {table: self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('entries', 'year_end_points', 'decade_points', 'artist_totals')}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def group_rows(columns, order):
+    # Group ids for the distinct combinations of the key columns, with the
+    # first row of each group (for its key) and its last row by `order`
+    # (for display values)
+    import numpy as np
+
+    codes = [np.unique(column.astype(str), return_inverse=True)[1] for column in columns]
+    combined = np.zeros(len(order), dtype=np.int64)
+    for code in codes:
+        combined = combined * (code.max() + 1) + code
+    _, first, groups = np.unique(combined, return_index=True, return_inverse=True)
+    by_order = np.lexsort((order, groups))
+    last = by_order[np.r_[groups[by_order][1:] != groups[by_order][:-1], True]]
+    return groups, first, last
+
+
+def group_min(groups, values):
+    import numpy as np
+
+    minimum = np.full(groups.max() + 1, np.iinfo(np.int64).max)
+    np.minimum.at(minimum, groups, values)
+    return minimum
+
+
+def group_distinct(groups, codes, mask=None):
+    # Number of distinct codes per group, counting only the masked rows
+    import numpy as np
+
+    width = codes.max() + 1
+    pairs = groups * width + codes
+    if mask is not None:
+        pairs = pairs[mask]
+    return np.bincount(np.unique(pairs) // width, minlength=groups.max() + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Year-end lists, decade points and artist totals")
+    parser.add_argument('--db', default=AGGREGATES_FILE)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild = subparsers.add_parser('rebuild', help="Recompute every aggregate from the raw entries")
+    rebuild.add_argument('sources', nargs='*', help="Reload the raw entries from these files first")
+    for name, help_text in (('year-end', "Top songs of a year by chart points"),
+                            ('decade', "Top songs of a decade by chart points")):
+        ranking = subparsers.add_parser(name, help=help_text)
+        ranking.add_argument('period', type=int)
+        ranking.add_argument('--chart-type', default='pop')
+        ranking.add_argument('--limit', type=int, default=100)
+    number_ones = subparsers.add_parser('number-ones', help="Artists by weeks at #1")
+    number_ones.add_argument('--chart-type', default='pop')
+    number_ones.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    from chart_digests import read_charts
+    aggregates = ChartAggregates(args.db)
+    try:
+        if args.command == 'rebuild':
+            started = time.perf_counter()
+            if args.sources:
+                aggregates.load_entries(chart for path in args.sources for chart in read_charts(path))
+            aggregates.rebuild()
+            counts = aggregates.counts()
+            print(f"Rebuilt in {time.perf_counter() - started:.1f}s: {counts['entries']} entries, "
+                  f"{counts['year_end_points']} song-years, {counts['decade_points']} song-decades, "
+                  f"{counts['artist_totals']} artists")
+        elif args.command == 'number-ones':
+            for position, row in enumerate(aggregates.number_ones(args.chart_type, args.limit), 1):
+                print(f"{position:>3}. {row['artist']}  {row['weeks_at_one']} weeks at #1, "
+                      f"{row['weeks_charted']} weeks charted, {row['songs']} songs")
+        else:
+            ranking = aggregates.year_end if args.command == 'year-end' else aggregates.decade
+            for row in ranking(args.period, args.chart_type, args.limit):
+                print(f"{row['position']:>3}. {row['title']} - {', '.join(row['artist'])}  "
+                      f"{row['points']} pts, {row['weeks']} weeks, peak #{row['peak']}")
+    finally:
+        aggregates.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import argparse
+import glob
+import json
+import os
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from chart_streams import read_chart_stream
+from crawl_targets import CHART_DECADES, chart_dates_of_year, decade_years, parse_chart_url
+
+CALENDAR_FILE = 'data/chart_calendar.json'
+# Where each stored chart's date came from; the charts CSV does not say
+DATE_LOG_FILE = 'data/chart_dates.jsonl'
+# tunecaster charts are dated on Saturdays unless observations say otherwise
+DEFAULT_WEEKDAY = 5
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def rule_date(year, week, weekday=DEFAULT_WEEKDAY, offset_weeks=0):
+    day = date(year, 1, 1)
+    day += timedelta(days=(weekday - day.weekday()) % 7)
+    return day + timedelta(weeks=week - 1 + offset_weeks)
+
+
+class ChartCalendar:
+    def __init__(self, charts=None, weekdays=None):
+        # charts: {chart_type: {YYWW: (YYYY-MM-DD, source)}}
+        self.charts = charts or {}
+        self.weekdays = weekdays or {}
+        # (chart_type, YY) -> [(YYWW, date)], built on first week_dates() call
+        self._by_year = None
+
+    @classmethod
+    def load(cls, path=CALENDAR_FILE):
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            charts = {
+                chart_type: {code: tuple(entry) for code, entry in codes.items()}
+                for chart_type, codes in data.get('charts', {}).items()
+            }
+            return cls(charts, data.get('weekdays', {}))
+        except Exception as e:
+            print(f"Could not load chart calendar: {e}")
+            return cls()
+
+    def save(self, path=CALENDAR_FILE):
+        # One week per line so rebuilds diff cleanly in git
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        lines = ['{', ' "version": 1,', f' "weekdays": {json.dumps(self.weekdays, sort_keys=True)},', ' "charts": {']
+        chart_types = sorted(self.charts)
+        for i, chart_type in enumerate(chart_types):
+            lines.append(f'  "{chart_type}": {{')
+            codes = sorted(self.charts[chart_type])
+            for j, code in enumerate(codes):
+                comma = ',' if j < len(codes) - 1 else ''
+                lines.append(f'   "{code}": {json.dumps(list(self.charts[chart_type][code]))}{comma}')
+            lines.append('  }' + (',' if i < len(chart_types) - 1 else ''))
+        lines += [' }', '}']
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+    def __bool__(self):
+        return any(self.charts.values())
+
+    def date_for(self, chart_type, code):
+        entry = self.charts.get(chart_type, {}).get(code)
+        return entry[0] if entry else None
+
+    def date_for_url(self, url):
+        parsed = parse_chart_url(url)
+        return self.date_for(*parsed) if parsed else None
+
+    def entry_for_url(self, url):
+        # (YYYY-MM-DD, source): 'page' dates were seen on the chart page, 'rule'
+        # dates are the weekday arithmetic and only as good as the rule
+        parsed = parse_chart_url(url)
+        return self.charts.get(parsed[0], {}).get(parsed[1]) if parsed else None
+
+    def page_observations(self):
+        for chart_type, codes in self.charts.items():
+            for code, (chart_date, source) in codes.items():
+                if source == 'page':
+                    yield chart_type, code, chart_date
+
+    def week_dates(self, chart_type, year):
+        # Drop-in for CrawlTarget(week_dates=...): exact dates where known, weekday rule otherwise
+        if self._by_year is None:
+            self._by_year = {}
+            for kind, codes in self.charts.items():
+                for code, value in sorted(codes.items()):
+                    self._by_year.setdefault((kind, code[:2]), []).append((code, value[0]))
+        known = self._by_year.get((chart_type, f"{year % 100:02d}"))
+        if known:
+            return [(int(code[2:]), date.fromisoformat(day)) for code, day in known]
+        return list(chart_dates_of_year(year, self.weekday(chart_type, year)))
+
+    def weekday(self, chart_type, year):
+        return self.weekdays.get(chart_type, {}).get(f"{year // 10 * 10 % 100:02d}", DEFAULT_WEEKDAY)
+
+
+def record_dates(charts, path=DATE_LOG_FILE):
+    # Appends one line per stored chart: the chart_info of the chart without
+    # its records. Crawls call this for every committed chart, so page dates
+    # reach the next calendar rebuild whatever the data file format
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for chart in charts:
+            info = chart['chart_info']
+            f.write(json.dumps({key: info.get(key) for key in ('url', 'chart_type', 'chart_date', 'date_source')}) + '\n')
+
+
+def read_date_log(path=DATE_LOG_FILE):
+    # {url: (YYYY-MM-DD, date_source)}; the latest line per URL wins
+    dates = {}
+    if os.path.exists(path):
+        for entry in read_chart_stream(path):
+            dates[entry['url']] = (entry['chart_date'], entry['date_source'])
+    return dates
+
+
+def read_observations(path):
+    # Yields (chart_type, YYWW, YYYY-MM-DD) for page-derived chart dates in the
+    # date log, a legacy JSON array or an NDJSON file (optionally gzipped).
+    # Only charts whose date_source is 'page' count: calendar, rule and URL
+    # dates came from the calendar in the first place. The charts CSV has no
+    # date source, so it cannot tell page dates apart and is not used
+    if path.endswith('.csv'):
+        print(f"Skipping {path}: the CSV does not record where chart dates came from; "
+              f"its page dates are in {DATE_LOG_FILE}")
+        return
+
+    for chart in read_chart_stream(path):
+        # Date log lines are a chart_info on their own
+        info = chart.get('chart_info', chart)
+        if info.get('date_source') != 'page':
+            continue
+        parsed = parse_chart_url(info.get('url', ''))
+        if parsed and info.get('chart_date'):
+            yield parsed[0], parsed[1], info['chart_date']
+
+
+def build_calendar(sources, min_weekday_votes=5, previous=None):
+    # Page dates of a previous calendar are kept as observations, so what
+    # earlier crawls learned survives a rebuild from newer data
+    observations = defaultdict(dict)
+    for chart_type, code, chart_date in (previous.page_observations() if previous else ()):
+        observations[chart_type][code] = date.fromisoformat(chart_date)
+    for path in sources:
+        try:
+            for chart_type, code, chart_date in read_observations(path):
+                observations[chart_type][code] = date.fromisoformat(chart_date)
+        except Exception as e:
+            print(f"Could not read observations from {path}: {e}")
+
+    report = {'observed': 0, 'accepted': 0, 'rejected': [], 'rule': 0}
+
+    # Weekday per chart type and decade: the dominant observed weekday if the
+    # evidence is strong, Saturday otherwise
+    weekdays = {}
+    for chart_type, codes in observations.items():
+        votes = defaultdict(Counter)
+        for code, chart_date in codes.items():
+            votes[f"{int(code[:2]) // 10 * 10:02d}"][chart_date.weekday()] += 1
+        for decade, counter in votes.items():
+            weekday, count = counter.most_common(1)[0]
+            if count >= min_weekday_votes and count / sum(counter.values()) >= 0.8 and weekday != DEFAULT_WEEKDAY:
+                weekdays.setdefault(chart_type, {})[decade] = weekday
+
+    calendar = ChartCalendar(weekdays=weekdays)
+    for chart_type, decades in CHART_DECADES.items():
+        entries = calendar.charts.setdefault(chart_type, {})
+        observed = observations.get(chart_type, {})
+        for decade in decades:
+            for year in decade_years(chart_type, decade):
+                weekday = calendar.weekday(chart_type, year)
+                rule = dict(chart_dates_of_year(year, weekday))
+
+                # A consistent whole-week shift in a year's observations moves the rule with it
+                shifts = Counter()
+                for week, rule_day in rule.items():
+                    seen = observed.get(f"{year % 100:02d}{week:02d}")
+                    if seen and seen.weekday() == weekday and abs((seen - rule_day).days) <= 7:
+                        shifts[(seen - rule_day).days // 7] += 1
+                offset = shifts.most_common(1)[0][0] if shifts else 0
+
+                for week in rule:
+                    code = f"{year % 100:02d}{week:02d}"
+                    expected = rule_date(year, week, weekday, offset)
+                    seen = observed.get(code)
+                    if seen is not None:
+                        report['observed'] += 1
+                        if seen.weekday() == weekday and abs((seen - expected).days) <= 7:
+                            entries[code] = (seen.isoformat(), 'page')
+                            report['accepted'] += 1
+                            continue
+                        report['rejected'].append((chart_type, code, seen.isoformat(), expected.isoformat()))
+                    entries[code] = (expected.isoformat(), 'rule')
+                    report['rule'] += 1
+
+    return calendar, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the YYWW -> chart date calendar")
+    parser.add_argument('sources', nargs='*',
+                        help="Date logs or chart data files with page-derived dates (.json, .jsonl[.gz])")
+    parser.add_argument('--output', default=CALENDAR_FILE)
+    parser.add_argument('--fresh', action='store_true',
+                        help="Ignore the page dates of the existing calendar")
+    args = parser.parse_args()
+
+    sources = args.sources or [
+        path for path in ['data/charts_data.json', DATE_LOG_FILE] + sorted(glob.glob('data/shards/*.jsonl'))
+        if os.path.exists(path)
+    ]
+    previous = None if args.fresh else ChartCalendar.load(args.output)
+    calendar, report = build_calendar(sources, previous=previous)
+    calendar.save(args.output)
+
+    total = sum(len(codes) for codes in calendar.charts.values())
+    print(f"Chart calendar: {total} weeks written to {args.output}")
+    print(f"Sources: {', '.join(sources) or 'none'}")
+    print(f"Page dates accepted: {report['accepted']}, rule dates: {report['rule']}, rejected: {len(report['rejected'])}")
+    for chart_type, code, seen, expected in report['rejected'][:20]:
+        print(f"  rejected {chart_type} {code}: page said {seen}, calendar expects {expected}")
+    for chart_type, decades in calendar.weekdays.items():
+        for decade, weekday in sorted(decades.items()):
+            print(f"  {chart_type} {decade}s charts are dated on {WEEKDAY_NAMES[weekday]}")
+
+
+if __name__ == "__main__":
+    main()
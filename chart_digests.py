@@ -0,0 +1,158 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+from chart_streams import parse_credits, read_chart_stream
+
+DIGEST_FILE = 'data/chart_digests.jsonl'
+CHANGES_FILE = 'data/chart_changes.jsonl'
+
+
+def normalize_records(records):
+    normalized = []
+    for record in records:
+        artists = record.get('artist') or []
+        if isinstance(artists, str):
+            artists = json.loads(artists) if artists.startswith('[') else [artists]
+        normalized.append([
+            int(record['rank']),
+            re.sub(r'\s+', ' ', str(record.get('title', ''))).strip(),
+            [re.sub(r'\s+', ' ', str(a)).strip() for a in artists],
+            record.get('chart_date', ''),
+        ])
+    normalized.sort(key=lambda r: r[0])
+    return normalized
+
+
+def chart_digest(chart_data):
+    payload = json.dumps(normalize_records(chart_data['records']), ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DigestManifest:
+    # Append-only log of (url, digest); the latest line per URL wins. Writing
+    # one line per changed chart keeps the cost independent of history size
+
+    def __init__(self, path=DIGEST_FILE, changes_file=CHANGES_FILE):
+        self.path = path
+        self.changes_file = changes_file
+        self.digests = {}
+        self.log_lines = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    self.digests[entry['url']] = entry['digest']
+                    self.log_lines += 1
+        except Exception as e:
+            print(f"Could not load chart digests: {e}")
+        # Superseded lines only cost load time; compact once they dominate
+        if self.log_lines > 2 * len(self.digests) + 1000:
+            self.compact()
+
+    def compact(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for url in sorted(self.digests):
+                f.write(json.dumps({'url': url, 'digest': self.digests[url]}) + '\n')
+        os.replace(tmp_path, self.path)
+        self.log_lines = len(self.digests)
+
+    def is_unchanged(self, url, digest):
+        return self.digests.get(url) == digest
+
+    def record(self, url, digest, chart_data=None):
+        previous = self.digests.get(url)
+        if previous == digest:
+            return False
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'url': url, 'digest': digest}) + '\n')
+        self.digests[url] = digest
+        self.log_lines += 1
+
+        if chart_data is not None and self.changes_file:
+            change = {
+                'url': url,
+                'change': 'new' if previous is None else 'changed',
+                'chart_type': chart_data['chart_info']['chart_type'],
+                'chart_date': chart_data['chart_info']['chart_date'],
+                'records': len(chart_data['records']),
+                'previous_digest': previous,
+                'digest': digest,
+                'detected_at': datetime.now().isoformat(),
+            }
+            with open(self.changes_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(change) + '\n')
+        return True
+
+
+def read_charts(path):
+    # Charts from a legacy JSON array, NDJSON (optionally gzipped) or the charts CSV
+    if path.endswith('.csv'):
+        charts = {}
+        previous_url = None
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                # Each stored chart is one block of rows; a later block for the
+                # same URL is a re-scrape and replaces the earlier one
+                if row['url'] != previous_url:
+                    charts.pop(row['url'], None)
+                    previous_url = row['url']
+                chart = charts.setdefault(row['url'], {
+                    'chart_info': {'chart_type': row['chart_type'], 'chart_date': row['chart_date'], 'url': row['url']},
+                    'records': [],
+                })
+                artists = parse_credits(row['artist'])
+                chart['records'].append({'rank': row['rank'], 'title': row['title'],
+                                         'artist': artists, 'chart_date': row['chart_date']})
+        yield from charts.values()
+    else:
+        yield from read_chart_stream(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-chart content digests")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    seed = subparsers.add_parser('seed', help="Record digests for charts already collected")
+    seed.add_argument('sources', nargs='+')
+    changes = subparsers.add_parser('changes', help="Show the change feed")
+    changes.add_argument('--since', default=None, help="Only changes detected at or after this ISO timestamp")
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        manifest = DigestManifest(changes_file=None)
+        seeded = 0
+        for path in args.sources:
+            for chart in read_charts(path):
+                if manifest.record(chart['chart_info']['url'], chart_digest(chart)):
+                    seeded += 1
+        manifest.compact()
+        print(f"Seeded {seeded} chart digests ({len(manifest.digests)} total) into {manifest.path}")
+    else:
+        if not os.path.exists(CHANGES_FILE):
+            print("No changes recorded")
+            return
+        with open(CHANGES_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                change = json.loads(line)
+                if args.since and change['detected_at'] < args.since:
+                    continue
+                print(f"{change['detected_at']} {change['change']:<8} {change['chart_type']:<5} "
+                      f"{change['chart_date']} {change['records']:>4} records  {change['url']}")
+
+
+if __name__ == "__main__":
+    main()
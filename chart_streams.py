@@ -0,0 +1,225 @@
+import argparse
+import csv
+import gzip
+import json
+import sys
+import time
+
+CSV_FIELDS = ['chart_date', 'chart_type', 'rank', 'title', 'artist', 'url']
+
+
+def open_text(path, mode):
+    # '-' is stdin/stdout; a .gz suffix means gzip
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8', newline='' if path.endswith('.csv') else None)
+
+
+def format_credits(artists):
+    # The CSV artist column: credits joined with ', ', or a JSON list when a
+    # name itself contains ', ' (or starts with '[') and joining would be lossy
+    if any(', ' in artist or artist.startswith('[') for artist in artists):
+        return json.dumps(list(artists), ensure_ascii=False)
+    return ', '.join(artists)
+
+
+def parse_credits(value):
+    # Inverse of format_credits
+    if not value:
+        return []
+    if value.startswith('['):
+        return json.loads(value)
+    return value.split(', ')
+
+
+def chart_with_artist_lists(chart_data):
+    # Scraped records carry the artist list as a JSON string; files carry the list
+    records = []
+    for record in chart_data['records']:
+        artists = record.get('artist') or []
+        if isinstance(artists, str):
+            artists = json.loads(artists) if artists.startswith('[') else [artists]
+        records.append(dict(record, artist=artists))
+    return dict(chart_data, records=records)
+
+
+class NDJSONSink:
+    # One chart per line, flushed as written so a downstream reader (or a
+    # crash) only ever sees whole lines. Exports replace the file; a crawl
+    # appends, so a resumed run continues the same stream
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.file = open_text(path, 'a' if append and path != '-' else 'w')
+        self.charts = 0
+
+    def write(self, chart_data):
+        self.file.write(json.dumps(chart_with_artist_lists(chart_data), ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.charts += 1
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVSink:
+    # Same columns as save_incremental_data
+    def __init__(self, path):
+        self.path = path
+        self.file = open_text(path, 'w')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_FIELDS)
+        self.charts = 0
+
+    def write(self, chart_data):
+        chart_type = chart_data['chart_info']['chart_type']
+        for record in chart_with_artist_lists(chart_data)['records']:
+            self.writer.writerow([record['chart_date'], chart_type, record['rank'], record['title'],
+                                  format_credits(record['artist']), record['url']])
+        self.charts += 1
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    # Yields the elements of a top-level JSON array while holding at most one
+    # element plus one read chunk in memory
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # Skip whitespace and separators between elements
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            chunk = f.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+
+        if position >= len(buffer):
+            if started:
+                raise ValueError("Unexpected end of JSON array")
+            return
+        char = buffer[position]
+        if not started:
+            if char != '[':
+                raise ValueError("Expected a JSON array")
+            started = True
+            position += 1
+            continue
+        if char == ']':
+            return
+        if char == ',':
+            position += 1
+            continue
+
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The element continues past the buffer; read more and retry
+            chunk = f.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        # Only accept the element once the ',' or ']' after it is in the
+        # buffer: a number cut by the chunk boundary ('123' + '45', '1.' + '5')
+        # decodes without error but is not the whole value
+        after = end
+        while after < len(buffer) and buffer[after] in ' \t\r\n':
+            after += 1
+        if after == len(buffer) or buffer[after] not in ',]':
+            if eof:
+                raise ValueError(f"Expected ',' or ']' after array element at offset {after}")
+            chunk = f.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        yield element
+        buffer, position = buffer[end:], 0
+
+
+def read_chart_stream(path):
+    # Charts from a legacy JSON array or NDJSON, either possibly gzipped or on stdin
+    f = open_text(path, 'r')
+    try:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first == '[':
+            yield from iter_json_array(_Prefixed(first, f))
+        elif first:
+            line = first + f.readline()
+            while line:
+                if line.strip():
+                    yield json.loads(line)
+                line = f.readline()
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+class _Prefixed:
+    # Puts back the characters read while sniffing the format
+    def __init__(self, prefix, f):
+        self.prefix = prefix
+        self.f = f
+
+    def read(self, size):
+        if self.prefix:
+            data, self.prefix = self.prefix + self.f.read(size - len(self.prefix)), ''
+            return data
+        return self.f.read(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert chart data between legacy JSON, NDJSON and CSV in constant memory")
+    parser.add_argument('source', help="Legacy JSON array or NDJSON (.gz ok, - for stdin)")
+    parser.add_argument('--ndjson', default=None, help="Write one chart per line here (.gz ok, - for stdout)")
+    parser.add_argument('--csv', default=None, help="Write flattened rows here (- for stdout)")
+    args = parser.parse_args()
+    if not args.ndjson and not args.csv:
+        parser.error("give --ndjson and/or --csv")
+    if args.ndjson == '-' and args.csv == '-':
+        parser.error("only one output can go to stdout")
+
+    sinks = []
+    if args.ndjson:
+        sinks.append(NDJSONSink(args.ndjson))
+    if args.csv:
+        sinks.append(CSVSink(args.csv))
+    started = time.perf_counter()
+    charts = 0
+    try:
+        for chart in read_chart_stream(args.source):
+            for sink in sinks:
+                sink.write(chart)
+            charts += 1
+    finally:
+        for sink in sinks:
+            sink.close()
+    print(f"Converted {charts} charts in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
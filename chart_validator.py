@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from binary_store import DATE_SOURCES, STORE_DIR, ChartStore, build_store, from_days, to_days
+from chart_calendar import DATE_LOG_FILE, ChartCalendar
+from crawl_targets import parse_chart_url
+
+RESCRAPE_FILE = 'data/rescrape_urls.txt'
+NO_DATE = np.iinfo(np.int32).min
+
+CHECKS = {
+    'empty': "no records",
+    'rank_gaps': "ranks not contiguous from 1",
+    'duplicate_ranks': "the same rank more than once",
+    'length': "length differs from the usual length for its chart type and decade",
+    'missing_artist': "records without an artist",
+    'spacing': "not 7 days from its neighbouring charts",
+    'url_date': "date came from the weekday rule or the URL fallback",
+    'calendar_mismatch': "date disagrees with the chart calendar",
+}
+
+
+def group_mode(groups, values):
+    # Most common value per group, broadcast back to the elements; ties go to the larger value
+    width = int(values.max()) + 1
+    pairs, counts = np.unique(groups * width + values, return_counts=True)
+    pair_groups, pair_values = pairs // width, pairs % width
+    # Sorted by group, then count, the last pair of each group is its mode
+    order = np.lexsort((counts, pair_groups))
+    last = order[np.r_[pair_groups[order][1:] != pair_groups[order][:-1], True]]
+    modes = np.zeros(int(groups.max()) + 1, dtype=values.dtype)
+    modes[pair_groups[last]] = pair_values[last]
+    return modes[groups]
+
+
+def calendar_days(calendar, chart_types):
+    # Dense (chart_type, YYWW) -> days table of page-confirmed dates, so the
+    # comparison is a single fancy index
+    table = np.full((len(chart_types), 10000), NO_DATE, dtype=np.int64)
+    for type_index, chart_type in enumerate(chart_types):
+        for code, (day, source) in calendar.charts.get(chart_type, {}).items():
+            if source == 'page':
+                table[type_index, int(code)] = to_days(day)
+    return table
+
+
+def validate_store(store, calendar=None):
+    charts = np.asarray(store.charts)
+    records = np.asarray(store.records)
+    n = len(charts)
+    issues = {name: np.zeros(n, dtype=bool) for name in CHECKS}
+    if not n:
+        return issues, {'charts': 0, 'records': 0, 'missing_weeks': 0, 'unknown_date_source': 0}
+
+    counts = charts['record_count'].astype(np.int64)
+    starts = charts['record_start'].astype(np.int64)
+    chart_of = records['chart_id'].astype(np.int64)
+    ranks = records['rank'].astype(np.int64)
+    issues['empty'] = counts == 0
+
+    # Ranks: records are sorted by rank within each chart
+    same_chart = chart_of[1:] == chart_of[:-1]
+    duplicate = same_chart & (ranks[1:] == ranks[:-1])
+    duplicates_per_chart = np.bincount(chart_of[1:][duplicate], minlength=n)
+    issues['duplicate_ranks'] = duplicates_per_chart > 0
+    nonempty = counts > 0
+    if nonempty.any():
+        min_rank = np.minimum.reduceat(ranks, starts[nonempty])
+        max_rank = np.maximum.reduceat(ranks, starts[nonempty])
+        distinct = counts[nonempty] - duplicates_per_chart[nonempty]
+        issues['rank_gaps'][nonempty] = (min_rank != 1) | (max_rank != distinct)
+
+    # Length against the most common length of the same chart type and decade
+    years = charts['date'].astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+    era = charts['chart_type'].astype(np.int64) * 1000 + years // 10
+    _, era_group = np.unique(era, return_inverse=True)
+    issues['length'] = nonempty & (counts != group_mode(era_group, counts))
+
+    # Artists: a song without credits
+    no_artist = np.asarray(store.songs['artist_count'])[records['song_id']] == 0
+    issues['missing_artist'] = np.bincount(chart_of[no_artist], minlength=n) > 0
+
+    # Week spacing: charts are sorted by (chart_type, date). A gap of a multiple
+    # of 7 days is missing weeks; any other gap, or a repeated date, means a
+    # chart is misdated, and the misdated one is off on every side it has
+    dates = charts['date'].astype(np.int64)
+    same_type = charts['chart_type'][1:] == charts['chart_type'][:-1]
+    gaps = np.diff(dates)
+    bad_gap = same_type & ((gaps % 7 != 0) | (gaps == 0))
+    has_prev, has_next = np.r_[False, same_type], np.r_[same_type, False]
+    bad_prev, bad_next = np.r_[False, bad_gap], np.r_[bad_gap, False]
+    issues['spacing'] = (has_prev | has_next) & (bad_prev | ~has_prev) & (bad_next | ~has_next)
+    missing_weeks = int(np.sum(np.where(same_type & (gaps > 7) & (gaps % 7 == 0), gaps // 7 - 1, 0)))
+
+    # Only a recorded rule or URL fallback is flagged. A correct date looks the
+    # same as a rule date, so charts without a date source are only counted
+    sources = charts['date_source']
+    issues['url_date'] = np.isin(sources, [DATE_SOURCES.index('url'), DATE_SOURCES.index('rule')])
+    unknown_date_source = int(np.sum(sources == DATE_SOURCES.index('unknown')))
+    if calendar:
+        table = calendar_days(calendar, store.meta['chart_types'])
+        expected = table[charts['chart_type'].astype(np.int64), charts['code'].astype(np.int64)]
+        issues['calendar_mismatch'] = (expected != NO_DATE) & (expected != dates)
+
+    return issues, {'charts': n, 'records': len(records), 'missing_weeks': missing_weeks,
+                    'unknown_date_source': unknown_date_source}
+
+
+def unstored_processed_urls(store, progress_file):
+    # Pages in the progress journal that never produced a stored chart
+    if not os.path.exists(progress_file):
+        return []
+    with open(progress_file, 'r', encoding='utf-8') as f:
+        processed = json.load(f).get('processed_urls', [])
+    chart_types = store.meta['chart_types']
+    stored = {(chart_types[t], f"{code:04d}")
+              for t, code in zip(store.charts['chart_type'].tolist(), store.charts['code'].tolist())}
+    return sorted(url for url in processed if parse_chart_url(url) and parse_chart_url(url) not in stored)
+
+
+def store_is_current(store_dir, sources):
+    # Built from these sources, and none of them (nor the date log) changed since
+    meta_path = os.path.join(store_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        if json.load(f).get('sources') != list(sources):
+            return False
+    built = os.path.getmtime(meta_path)
+    return all(os.path.getmtime(path) <= built for path in list(sources) + [DATE_LOG_FILE] if os.path.exists(path))
+
+
+def run_validation(sources=None, store_dir=STORE_DIR, progress_file='data/scraper_progress.json',
+                   output=RESCRAPE_FILE, base_url='https://tunecaster.com', skip=''):
+    # Given sources are always rebuilt. By default both data files are used,
+    # the CSV last so its copy of a chart wins, and the store is rebuilt
+    # whenever it is older than them
+    if not sources:
+        sources = [p for p in ['data/charts_data.json', 'data/charts_data.csv'] if os.path.exists(p)]
+        print(f"Sources: {', '.join(sources) or 'none'}")
+        if not store_is_current(store_dir, sources):
+            build_store(sources, store_dir)
+    else:
+        build_store(sources, store_dir)
+    store = ChartStore(store_dir)
+    issues, totals = validate_store(store, ChartCalendar.load())
+    skipped = {name.strip() for name in skip.split(',') if name.strip()}
+
+    flagged = np.zeros(len(store.charts), dtype=bool)
+    print(f"Checked {totals['charts']} charts, {totals['records']} records")
+    for name, description in CHECKS.items():
+        count = int(issues[name].sum())
+        note = ' (skipped)' if name in skipped else ''
+        print(f"  {name:<18} {count:>6}  {description}{note}")
+        if name not in skipped:
+            flagged |= issues[name]
+    print(f"  {'missing_weeks':<18} {totals['missing_weeks']:>6}  gaps between stored charts (see 'status')")
+    print(f"  {'url_date unknown':<18} {totals['unknown_date_source']:>6}  no recorded date source, "
+          f"url_date not checked and not re-scraped")
+    unstored = unstored_processed_urls(store, progress_file)
+    print(f"  {'not_stored':<18} {len(unstored):>6}  marked processed but no chart stored")
+
+    for chart_id in np.flatnonzero(flagged)[:10]:
+        chart = store.charts[chart_id]
+        reasons = [name for name in CHECKS if name not in skipped and issues[name][chart_id]]
+        print(f"    {store.chart_type(chart['chart_type'])} {from_days(chart['date'])} "
+              f"{int(chart['record_count'])} records: {', '.join(reasons)}")
+
+    urls = {store.chart_url(int(chart_id), base_url) for chart_id in np.flatnonzero(flagged)}
+    urls = sorted(urls | set(unstored))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        f.writelines(url + '\n' for url in urls)
+    print(f"{len(urls)} URLs to re-scrape written to {output}")
+    print(f"Re-scrape them with: python tunecaster_charts_scraper.py crawl --urls-from {output}")
+    return urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check collected charts and list the pages to re-scrape")
+    parser.add_argument('sources', nargs='*', help="Rebuild the binary store from these files first")
+    parser.add_argument('--store', default=STORE_DIR)
+    parser.add_argument('--progress-file', default='data/scraper_progress.json')
+    parser.add_argument('--output', default=RESCRAPE_FILE)
+    parser.add_argument('--base-url', default='https://tunecaster.com')
+    parser.add_argument('--skip', default='', help="Comma separated checks to ignore, e.g. length,spacing")
+    args = parser.parse_args()
+    run_validation(args.sources, args.store, args.progress_file, args.output, args.base_url, args.skip)
+
+
+if __name__ == "__main__":
+    main()
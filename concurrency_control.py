@@ -0,0 +1,144 @@
+import time
+from datetime import datetime, timezone
+
+# Outcomes that mean the site is struggling or throttling us
+THROTTLE_STATUSES = {429, 503}
+TIMEOUT_ERRORS = {'TimeoutError', 'asyncio.TimeoutError'}
+
+
+def parse_retry_after(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    from email.utils import parsedate_to_datetime
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_backoff_outcome(status=None, error=None):
+    if status is not None and (status in THROTTLE_STATUSES or status >= 500):
+        return True
+    return error in TIMEOUT_ERRORS
+
+
+class AIMDConcurrencyController:
+    def __init__(self, min_limit=1, max_limit=8, initial_limit=1, increase_step=1.0,
+                 decrease_factor=0.5, latency_spike_ratio=2.0, error_rate_threshold=0.2,
+                 max_retry_after=300):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_spike_ratio = latency_spike_ratio
+        self.error_rate_threshold = error_rate_threshold
+        self.max_retry_after = max_retry_after
+
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        # Fast EWMA tracks current latency, slow EWMA the healthy baseline
+        self.latency_fast = None
+        self.latency_baseline = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.stats = {'successes': 0, 'errors': 0, 'decreases': 0, 'increases': 0, 'retry_after_waits': 0}
+        import asyncio
+        self.condition = asyncio.Condition()
+
+    @property
+    def current_limit(self):
+        return max(self.min_limit, int(self.limit))
+
+    def metrics(self):
+        return {
+            'concurrency_limit': self.current_limit,
+            'concurrency_limit_raw': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'latency_ewma_ms': round((self.latency_fast or 0) * 1000, 1),
+            'latency_baseline_ms': round((self.latency_baseline or 0) * 1000, 1),
+            'error_rate': round(self.error_rate, 3),
+            'paused_for': round(max(0.0, self.paused_until - time.monotonic()), 1),
+            **self.stats,
+        }
+
+    async def acquire(self):
+        import asyncio
+        async with self.condition:
+            while True:
+                wait_for = self.paused_until - time.monotonic()
+                if wait_for > 0:
+                    # Honour Retry-After: nobody starts a request until it expires
+                    self.condition.release()
+                    try:
+                        await asyncio.sleep(wait_for)
+                    finally:
+                        await self.condition.acquire()
+                    continue
+                if self.in_flight < self.current_limit:
+                    self.in_flight += 1
+                    return
+                await self.condition.wait()
+
+    async def release(self, latency, status=None, error=None, retry_after=None):
+        async with self.condition:
+            self.in_flight = max(0, self.in_flight - 1)
+            self.record(latency, status, error, retry_after)
+            self.condition.notify_all()
+
+    def record(self, latency, status=None, error=None, retry_after=None):
+        now = time.monotonic()
+        failed = is_backoff_outcome(status, error)
+        self.error_rate = 0.9 * self.error_rate + (0.1 if failed or error else 0.0)
+
+        delay = parse_retry_after(retry_after)
+        if delay:
+            self.paused_until = max(self.paused_until, now + min(delay, self.max_retry_after))
+            self.stats['retry_after_waits'] += 1
+
+        if failed:
+            self.stats['errors'] += 1
+            self.decrease(now)
+            return
+
+        if latency is not None:
+            self.samples += 1
+            self.latency_fast = latency if self.latency_fast is None else 0.7 * self.latency_fast + 0.3 * latency
+            self.latency_baseline = latency if self.latency_baseline is None else 0.95 * self.latency_baseline + 0.05 * latency
+            if self.samples >= 5 and self.latency_fast > self.latency_baseline * self.latency_spike_ratio:
+                self.decrease(now)
+                return
+
+        if error:
+            self.stats['errors'] += 1
+            return
+
+        self.stats['successes'] += 1
+        if self.error_rate <= self.error_rate_threshold and self.limit < self.max_limit:
+            # Additive increase: roughly +increase_step per window of `limit` successes
+            previous = self.current_limit
+            self.limit = min(self.max_limit, self.limit + self.increase_step / self.limit)
+            if self.current_limit > previous:
+                self.stats['increases'] += 1
+                print(f"Concurrency limit raised to {self.current_limit}")
+
+    def decrease(self, now):
+        # One cut per latency window, so a burst of failures from requests that
+        # were already in flight does not collapse the limit to the floor
+        cooldown = self.latency_fast or 1.0
+        if now - self.last_decrease < cooldown:
+            return
+        previous = self.current_limit
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+        self.last_decrease = now
+        self.stats['decreases'] += 1
+        print(f"Concurrency limit cut from {previous} to {self.current_limit}")
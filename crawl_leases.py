@@ -0,0 +1,408 @@
+import asyncio
+import csv
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from chart_streams import format_credits
+from concurrency_control import is_backoff_outcome
+
+
+class SQLiteLeaseStore:
+    # Shared work table; every state change happens inside BEGIN IMMEDIATE so
+    # concurrent nodes on the same file never hand out the same URL twice
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS chart_leases (
+                url TEXT PRIMARY KEY,
+                chart_type TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated REAL
+            )
+        ''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS chart_leases_status ON chart_leases (status, lease_expires)')
+
+    def add_urls(self, work):
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO chart_leases (url, chart_type, updated) VALUES (?, ?, ?)",
+                [(url, chart_type, time.time()) for url, chart_type in work]
+            )
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def claim_batch(self, owner, batch_size, lease_seconds):
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.db.execute(
+                "SELECT url, chart_type, attempts + 1 FROM chart_leases "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY url LIMIT ?",
+                (now, batch_size)
+            ).fetchall()
+            self.db.executemany(
+                "UPDATE chart_leases SET status = 'leased', owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE url = ?",
+                [(owner, now + lease_seconds, now, url) for url, _, _ in rows]
+            )
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        # (url, chart_type, attempts including this claim)
+        return rows
+
+    def renew(self, owner, urls, lease_seconds):
+        now = time.time()
+        self.db.executemany(
+            "UPDATE chart_leases SET lease_expires = ?, updated = ? "
+            "WHERE url = ? AND owner = ? AND status = 'leased'",
+            [(now + lease_seconds, now, url, owner) for url in urls]
+        )
+
+    def complete(self, owner, url, ok=True):
+        cursor = self.db.execute(
+            "UPDATE chart_leases SET status = ?, lease_expires = NULL, updated = ? "
+            "WHERE url = ? AND owner = ? AND status = 'leased'",
+            ('done' if ok else 'failed', time.time(), url, owner)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, owner, urls):
+        self.db.executemany(
+            "UPDATE chart_leases SET status = 'pending', owner = NULL, lease_expires = NULL, updated = ? "
+            "WHERE url = ? AND owner = ? AND status = 'leased'",
+            [(time.time(), url, owner) for url in urls]
+        )
+
+    def counts(self):
+        now = time.time()
+        counts = {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0, 'failed': 0}
+        for status, expired, count in self.db.execute(
+                "SELECT status, status = 'leased' AND lease_expires < ?, COUNT(*) "
+                "FROM chart_leases GROUP BY 1, 2", (now,)):
+            counts['expired' if expired else status] += count
+        return counts
+
+    def close(self):
+        self.db.close()
+
+
+class LockDirLeaseStore:
+    # Same contract as SQLiteLeaseStore on a plain (shared) directory:
+    #   tasks/<key>.json   one per chart URL, with the number of claims so far
+    #   leases/<key>.lease holds owner and expiry, changed only under leases/<key>.lock
+    #   done/<key>         completion marker ('done' or 'failed')
+
+    def __init__(self, directory):
+        self.directory = directory
+        for name in ('tasks', 'leases', 'done'):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def path(self, kind, key):
+        suffix = {'tasks': '.json', 'leases': '.lease', 'done': ''}[kind]
+        return os.path.join(self.directory, kind, key + suffix)
+
+    def write_atomic(self, path, payload):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    def read_json(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def add_urls(self, work):
+        for url, chart_type in work:
+            path = self.path('tasks', self.key(url))
+            if not os.path.exists(path):
+                self.write_atomic(path, {'url': url, 'chart_type': chart_type})
+
+    @contextmanager
+    def locked(self, key):
+        # Every change to a lease is a read-check-write under this key's lock,
+        # so the lease file is only ever replaced whole and never goes missing
+        # while it is held. POSIX record locks work on NFS and are released if
+        # the holding process dies
+        with open(self.path('leases', key) + '.lock', 'a') as f:
+            fcntl.lockf(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+
+    def try_lease(self, key, owner, expires):
+        lease_path = self.path('leases', key)
+        with self.locked(key):
+            lease = self.read_json(lease_path)
+            if lease is not None and lease.get('expires', 0) >= time.time():
+                return False
+            self.write_atomic(lease_path, {'owner': owner, 'expires': expires})
+            return True
+
+    def claim_batch(self, owner, batch_size, lease_seconds):
+        expires = time.time() + lease_seconds
+        claimed = []
+        for name in sorted(os.listdir(os.path.join(self.directory, 'tasks'))):
+            if len(claimed) >= batch_size:
+                break
+            if not name.endswith('.json'):
+                continue
+            key = name[:-5]
+            if os.path.exists(self.path('done', key)):
+                continue
+            if self.try_lease(key, owner, expires):
+                if os.path.exists(self.path('done', key)):
+                    self.drop(key, owner)
+                    continue
+                # Only the lease holder rewrites the task, so the count is exact
+                task = self.read_json(self.path('tasks', key))
+                task['attempts'] = task.get('attempts', 0) + 1
+                self.write_atomic(self.path('tasks', key), task)
+                claimed.append((task['url'], task['chart_type'], task['attempts']))
+        return claimed
+
+    def owns(self, key, owner):
+        lease = self.read_json(self.path('leases', key))
+        return lease is not None and lease.get('owner') == owner
+
+    def drop(self, key, owner):
+        # Removes the lease only if it is still this owner's
+        with self.locked(key):
+            if not self.owns(key, owner):
+                return False
+            os.remove(self.path('leases', key))
+            return True
+
+    def renew(self, owner, urls, lease_seconds):
+        for url in urls:
+            key = self.key(url)
+            with self.locked(key):
+                if self.owns(key, owner):
+                    self.write_atomic(self.path('leases', key), {'owner': owner, 'expires': time.time() + lease_seconds})
+
+    def complete(self, owner, url, ok=True):
+        key = self.key(url)
+        with self.locked(key):
+            if not self.owns(key, owner):
+                return False
+            with open(self.path('done', key), 'w', encoding='utf-8') as f:
+                f.write('done' if ok else 'failed')
+            os.remove(self.path('leases', key))
+        return True
+
+    def release(self, owner, urls):
+        for url in urls:
+            self.drop(self.key(url), owner)
+
+    def counts(self):
+        counts = {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0, 'failed': 0}
+        now = time.time()
+        for name in os.listdir(os.path.join(self.directory, 'tasks')):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-5]
+            done_path = self.path('done', key)
+            if os.path.exists(done_path):
+                with open(done_path, 'r', encoding='utf-8') as f:
+                    counts['failed' if f.read().strip() == 'failed' else 'done'] += 1
+                continue
+            lease = self.read_json(self.path('leases', key))
+            if lease is None:
+                counts['pending'] += 1
+            elif lease.get('expires', 0) < now:
+                counts['expired'] += 1
+            else:
+                counts['leased'] += 1
+        return counts
+
+    def close(self):
+        pass
+
+
+def open_lease_store(spec):
+    # 'sqlite:data/leases.sqlite' or 'dir:/mnt/shared/leases'
+    kind, _, location = spec.partition(':')
+    if kind == 'sqlite' and location:
+        return SQLiteLeaseStore(location)
+    if kind == 'dir' and location:
+        return LockDirLeaseStore(location)
+    raise ValueError(f"Invalid lease store: {spec} (use sqlite:PATH or dir:PATH)")
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeasedCrawl:
+    def __init__(self, scraper, store, node_id=None, results_dir='data/shards', batch_size=20, lease_seconds=600):
+        self.scraper = scraper
+        self.store = store
+        self.node_id = node_id or default_node_id()
+        self.results_dir = results_dir
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.shard_file = os.path.join(results_dir, f"{self.node_id}.jsonl")
+        self.held = set()
+        self.completed = 0
+
+    def seed(self):
+        work = [(url, 'rock') for url in self.scraper.rock_urls] + [(url, 'pop') for url in self.scraper.pop_urls]
+        if work:
+            self.store.add_urls(work)
+        return len(work)
+
+    async def renew_leases(self):
+        # Heartbeat: keep the leases of a slow batch from expiring under us
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if self.held:
+                self.store.renew(self.node_id, list(self.held), self.lease_seconds)
+
+    def write_shard(self, chart_data):
+        os.makedirs(self.results_dir, exist_ok=True)
+        entry = dict(chart_data, node_id=self.node_id, scraped_at=datetime.now().isoformat())
+        with open(self.shard_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def process(self, url, chart_type, attempts):
+        controller = self.scraper.concurrency
+        await controller.acquire()
+        outcome = {}
+        started = time.perf_counter()
+        try:
+            chart_data = await self.scraper.scrape_single_chart(url, chart_type, outcome)
+        except Exception as e:
+            outcome['error'] = e.__class__.__name__
+            chart_data = None
+        latency = time.perf_counter() - started
+        try:
+            await asyncio.sleep(self.scraper.request_delay)
+        finally:
+            await controller.release(latency, outcome.get('status'), outcome.get('error'), outcome.get('retry_after'))
+
+        if (chart_data is None and attempts <= self.scraper.max_retries and
+                is_backoff_outcome(outcome.get('status'), outcome.get('error'))):
+            # Hand it back instead of failing it; the next claim picks it up again
+            self.store.release(self.node_id, [url])
+        else:
+            if chart_data:
+                self.write_shard(chart_data)
+            if not self.store.complete(self.node_id, url, ok=bool(chart_data)):
+                print(f"Lease on {url} was lost before completion; the merge keeps one copy")
+            self.completed += 1
+            records = len(chart_data['records']) if chart_data else 0
+            print(f"[{self.node_id}] {url} ({chart_type}): {records} records")
+        self.held.discard(url)
+
+    async def run(self, idle_wait=None):
+        renewer = asyncio.create_task(self.renew_leases())
+        try:
+            while True:
+                batch = self.store.claim_batch(self.node_id, self.batch_size, self.lease_seconds)
+                if not batch:
+                    counts = self.store.counts()
+                    if counts['leased'] == 0 and counts['expired'] == 0:
+                        break
+                    # Others hold live leases; wait for them to finish or expire
+                    print(f"[{self.node_id}] waiting for leased charts: {counts}")
+                    await asyncio.sleep(idle_wait or min(60, self.lease_seconds / 4))
+                    continue
+                self.held.update(url for url, _, _ in batch)
+                print(f"[{self.node_id}] claimed {len(batch)} charts")
+                await asyncio.gather(*(self.process(*task) for task in batch))
+        finally:
+            renewer.cancel()
+            if self.held:
+                self.store.release(self.node_id, list(self.held))
+        print(f"[{self.node_id}] finished {self.completed} charts; store: {self.store.counts()}")
+        return self.completed
+
+
+def read_shards(results_dir):
+    for path in sorted(glob.glob(os.path.join(results_dir, '*.jsonl'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A node killed mid-write leaves a truncated last line
+                    print(f"Skipping truncated line in {path}")
+
+
+def merge_shards(results_dir, output_json='data/charts_data_merged.json', output_csv=None):
+    # Deterministic: for each chart URL the whole copy with the latest
+    # (scraped_at, node_id) wins, whatever order the shards are read in, so
+    # records of two scrapes of one chart are never mixed
+    best = {}
+    for chart in read_shards(results_dir):
+        version = (chart.get('scraped_at', ''), chart.get('node_id', ''))
+        url = chart['chart_info']['url']
+        if url not in best or version > best[url][0]:
+            best[url] = (version, chart)
+
+    merged = []
+    for url in best:
+        _, chart = best[url]
+        info = chart['chart_info']
+        records = []
+        for record in chart['records']:
+            artists = json.loads(record['artist']) if isinstance(record['artist'], str) else record['artist']
+            records.append(dict(record, artist=artists))
+        merged.append({
+            'chart_info': {'chart_type': info['chart_type'], 'chart_date': info['chart_date'], 'url': url},
+            'records': records,
+        })
+
+    merged.sort(key=lambda c: (c['chart_info']['chart_type'], c['chart_info']['chart_date'], c['chart_info']['url']))
+    for chart in merged:
+        chart['records'].sort(key=lambda r: (r['rank'], r['id']))
+
+    os.makedirs(os.path.dirname(output_json) or '.', exist_ok=True)
+    with open(output_json, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, indent=2, ensure_ascii=False)
+
+    if output_csv:
+        with open(output_csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['chart_date', 'chart_type', 'rank', 'title', 'artist', 'url'])
+            for chart in merged:
+                for record in chart['records']:
+                    writer.writerow([record['chart_date'], chart['chart_info']['chart_type'], record['rank'],
+                                     record['title'], format_credits(record['artist']), record['url']])
+
+    total_records = sum(len(c['records']) for c in merged)
+    print(f"Merged {len(merged)} charts, {total_records} records into {output_json}")
+    return merged
@@ -0,0 +1,193 @@
+import asyncio
+import cProfile
+import functools
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+
+PARSE_FUNCTIONS = (
+    'parse_chart',
+    'extract_songs_from_html',
+    'extract_chart_date_from_page',
+    'find_artist_in_next_tables',
+)
+
+
+class CrawlProfiler:
+    # Everything is attached to a scraper instance at runtime, so a crawl
+    # without --profile runs the original unwrapped methods
+
+    def __init__(self, report_file='data/profile_report.txt', snapshot_every=25,
+                 lag_interval=0.05, lag_threshold=0.1, top=25):
+        self.report_file = report_file
+        self.snapshot_every = snapshot_every
+        self.lag_interval = lag_interval
+        self.lag_threshold = lag_threshold
+        self.top = top
+
+        self.profile = cProfile.Profile()
+        self.depth = 0
+        self.timings = {name: {'calls': 0, 'seconds': 0.0, 'max': 0.0} for name in PARSE_FUNCTIONS}
+        self.charts_seen = 0
+        self.scraper = None
+
+        self.snapshots = []
+        self.checkpoints = []
+
+        self.lag_samples = []
+        self.lag_task = None
+        self.started = None
+
+    def attach(self, scraper):
+        self.scraper = scraper
+        for name in PARSE_FUNCTIONS:
+            setattr(scraper, name, self.wrap(name, getattr(scraper, name)))
+        commit_batch = scraper.commit_batch
+
+        def counted_commit(batch):
+            result = commit_batch(batch)
+            before = self.charts_seen
+            self.charts_seen += len(batch)
+            if self.snapshot_every and self.charts_seen // self.snapshot_every > before // self.snapshot_every:
+                self.checkpoint(f"after {self.charts_seen} charts")
+            return result
+
+        scraper.commit_batch = counted_commit
+        return self
+
+    def wrap(self, name, function):
+        timing = self.timings[name]
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            # parse_chart calls the other parse functions, so only the outermost
+            # call switches the profiler on and off
+            if self.depth == 0:
+                self.profile.enable()
+            self.depth += 1
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.depth -= 1
+                if self.depth == 0:
+                    self.profile.disable()
+                timing['calls'] += 1
+                timing['seconds'] += elapsed
+                timing['max'] = max(timing['max'], elapsed)
+
+        return wrapper
+
+    async def start(self):
+        self.started = time.perf_counter()
+        tracemalloc.start(10)
+        self.checkpoint('start')
+        self.lag_task = asyncio.create_task(self.monitor_loop_lag())
+
+    async def monitor_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            self.lag_samples.append(max(0.0, loop.time() - expected))
+
+    def checkpoint(self, label):
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        charts = len(self.scraper.all_chart_data) if self.scraper else 0
+        records = sum(len(c.get('records', [])) for c in self.scraper.all_chart_data) if self.scraper else 0
+        self.snapshots.append((label, tracemalloc.take_snapshot()))
+        self.checkpoints.append({
+            'label': label,
+            'elapsed': time.perf_counter() - self.started if self.started else 0.0,
+            'current_mb': current / 1024 / 1024,
+            'peak_mb': peak / 1024 / 1024,
+            'charts_in_memory': charts,
+            'records_in_memory': records,
+        })
+        # Only the first and the latest snapshot are needed for the report
+        if len(self.snapshots) > 2:
+            del self.snapshots[1:-1]
+
+    async def finish(self):
+        if self.lag_task:
+            self.lag_task.cancel()
+            try:
+                await self.lag_task
+            except asyncio.CancelledError:
+                pass
+        self.checkpoint('end')
+        report = self.build_report()
+        tracemalloc.stop()
+
+        os.makedirs(os.path.dirname(self.report_file) or '.', exist_ok=True)
+        with open(self.report_file, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Profile report written to {self.report_file}")
+        return report
+
+    def build_report(self):
+        lines = [
+            "TUNECASTER CRAWL PROFILE",
+            f"Generated: {datetime.now().isoformat()}",
+            f"Charts stored: {self.charts_seen}",
+            "",
+            "PARSE FUNCTION TIMINGS (wall clock, ranked by total)",
+            f"{'function':<32}{'calls':>8}{'total s':>12}{'mean ms':>12}{'max ms':>12}",
+        ]
+        for name, timing in sorted(self.timings.items(), key=lambda item: -item[1]['seconds']):
+            mean = timing['seconds'] / timing['calls'] * 1000 if timing['calls'] else 0.0
+            lines.append(f"{name:<32}{timing['calls']:>8}{timing['seconds']:>12.3f}{mean:>12.2f}{timing['max'] * 1000:>12.2f}")
+
+        lines += ["", f"HOT SPOTS (cProfile, top {self.top} by own time)"]
+        lines.append(self.format_stats('tottime'))
+        lines += [f"HOT SPOTS (cProfile, top {self.top} by cumulative time)"]
+        lines.append(self.format_stats('cumulative'))
+
+        lines += ["EVENT LOOP LAG"]
+        if self.lag_samples:
+            ordered = sorted(self.lag_samples)
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            stalls = sum(1 for lag in ordered if lag >= self.lag_threshold)
+            lines.append(
+                f"samples={len(ordered)} mean={sum(ordered) / len(ordered) * 1000:.1f}ms "
+                f"p99={p99 * 1000:.1f}ms max={ordered[-1] * 1000:.1f}ms "
+                f"stalls>={self.lag_threshold * 1000:.0f}ms: {stalls}"
+            )
+        else:
+            lines.append("no samples")
+
+        lines += ["", "MEMORY CHECKPOINTS (tracemalloc)",
+                  f"{'checkpoint':<24}{'elapsed s':>11}{'current MB':>12}{'peak MB':>10}{'charts':>8}{'records':>9}"]
+        for point in self.checkpoints:
+            lines.append(
+                f"{point['label']:<24}{point['elapsed']:>11.1f}{point['current_mb']:>12.1f}"
+                f"{point['peak_mb']:>10.1f}{point['charts_in_memory']:>8}{point['records_in_memory']:>9}"
+            )
+
+        if self.snapshots:
+            latest = self.snapshots[-1][1]
+            lines += ["", f"TOP ALLOCATION SITES (live at end, top {self.top})"]
+            for stat in latest.statistics('lineno')[:self.top]:
+                lines.append(f"{stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {stat.traceback}")
+            if len(self.snapshots) > 1:
+                first_label, first = self.snapshots[0]
+                lines += ["", f"ALLOCATION GROWTH SINCE '{first_label}' (top {self.top})"]
+                for stat in latest.compare_to(first, 'lineno')[:self.top]:
+                    lines.append(f"{stat.size_diff / 1024:>+10.1f} KiB {stat.count_diff:>+8} blocks  {stat.traceback}")
+
+        return '\n'.join(lines) + '\n'
+
+    def format_stats(self, sort_key):
+        stream = io.StringIO()
+        try:
+            stats = pstats.Stats(self.profile, stream=stream)
+            stats.strip_dirs().sort_stats(sort_key).print_stats(self.top)
+        except TypeError:
+            stream.write("no profile data collected\n")
+        return stream.getvalue()
@@ -0,0 +1,138 @@
+import re
+from datetime import date, timedelta
+
+# Decade directories each chart type exists for on tunecaster.com
+CHART_DECADES = {
+    'pop': ('60', '70', '80', '90', '00', '10'),
+    'rock': ('80', '90', '00', '10'),
+}
+# Last year with charts per type; the site stopped publishing after 2014
+CHART_LAST_YEAR = {'pop': 2014, 'rock': 2014}
+CHART_PREFIX = {'pop': 'week', 'rock': 'rock'}
+PREFIX_CHART_TYPE = {prefix: chart_type for chart_type, prefix in CHART_PREFIX.items()}
+CHART_URL_PATTERN = re.compile(r'/charts/(\d{2})/(week|rock)(\d{4})\.html')
+
+
+def full_year(year_suffix):
+    return 1900 + year_suffix if year_suffix >= 60 else 2000 + year_suffix
+
+
+def decade_dir(year):
+    return f"{(year // 10 * 10) % 100:02d}"
+
+
+def normalize_decade(value):
+    # Accepts '2010s', '1980', '80s', '80', 0 ... and returns the two-digit directory
+    text = str(value).strip().lower().rstrip('s')
+    if not text.isdigit():
+        raise ValueError(f"Invalid decade: {value}")
+    if len(text) == 4:
+        return decade_dir(int(text))
+    if len(text) == 1:
+        return f"{int(text) * 10:02d}"
+    return f"{int(text) // 10 * 10:02d}"
+
+
+def decade_years(chart_type, decade):
+    # The years of a decade directory that actually have charts of this type
+    first = full_year(int(decade))
+    return range(first, min(first + 10, CHART_LAST_YEAR[chart_type] + 1))
+
+
+def chart_dates_of_year(year, weekday=5):
+    # Charts are dated on Saturdays; week N is the Nth Saturday of the year
+    day = date(year, 1, 1)
+    day += timedelta(days=(weekday - day.weekday()) % 7)
+    week = 1
+    while day.year == year:
+        yield week, day
+        day += timedelta(weeks=1)
+        week += 1
+
+
+def parse_chart_url(url):
+    match = CHART_URL_PATTERN.search(url)
+    if not match:
+        return None
+    return PREFIX_CHART_TYPE[match.group(2)], match.group(3)
+
+
+def chart_url(base_url, chart_type, code):
+    year = full_year(int(code[:2]))
+    return f"{base_url.rstrip('/')}/charts/{decade_dir(year)}/{CHART_PREFIX[chart_type]}{code}.html"
+
+
+class CrawlTarget:
+    def __init__(self, start_date=None, end_date=None, decades=None, chart_types=None, week_dates=None):
+        self.start_date = self.to_date(start_date) if start_date else None
+        self.end_date = self.to_date(end_date, end=True) if end_date else None
+        self.decades = {normalize_decade(d) for d in decades} if decades else None
+        self.chart_types = list(chart_types) if chart_types else ['rock', 'pop']
+        for chart_type in self.chart_types:
+            if chart_type not in CHART_DECADES:
+                raise ValueError(f"Invalid chart type: {chart_type}")
+        # week_dates(chart_type, year) -> [(week, date)]; defaults to the Saturday rule
+        self.week_dates = week_dates or (lambda chart_type, year: chart_dates_of_year(year))
+        self.codes = self.compute_codes()
+        # Flat set of (chart_type, YYWW) keys so matches() is a single lookup
+        self.keys = frozenset((chart_type, code) for chart_type, codes in self.codes.items() for code in codes)
+
+    @staticmethod
+    def to_date(value, end=False):
+        # Partial dates cover the whole year or month: '1999' ends on 1999-12-31
+        if isinstance(value, date):
+            return value
+        text = str(value)
+        if len(text) == 4:
+            return date(int(text), 12, 31) if end else date(int(text), 1, 1)
+        if len(text) == 7:
+            year, month = int(text[:4]), int(text[5:7])
+            if end:
+                return date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+            return date(year, month, 1)
+        return date.fromisoformat(text)
+
+    def years(self, chart_type):
+        for decade in CHART_DECADES[chart_type]:
+            if self.decades is not None and decade not in self.decades:
+                continue
+            for year in decade_years(chart_type, decade):
+                if self.start_date and year < self.start_date.year:
+                    continue
+                if self.end_date and year > self.end_date.year:
+                    continue
+                yield year
+
+    def compute_codes(self):
+        codes = {}
+        for chart_type in self.chart_types:
+            selected = []
+            for year in sorted(self.years(chart_type)):
+                for week, chart_date in self.week_dates(chart_type, year):
+                    if self.start_date and chart_date < self.start_date:
+                        continue
+                    if self.end_date and chart_date > self.end_date:
+                        continue
+                    selected.append(f"{year % 100:02d}{week:02d}")
+            codes[chart_type] = selected
+        return codes
+
+    def chart_urls(self, base_url):
+        return {
+            chart_type: [chart_url(base_url, chart_type, code) for code in codes]
+            for chart_type, codes in self.codes.items()
+        }
+
+    def matches(self, url):
+        return parse_chart_url(url) in self.keys
+
+    def describe(self):
+        parts = [f"types={','.join(self.chart_types)}"]
+        if self.decades:
+            parts.append(f"decades={','.join(sorted(self.decades))}")
+        if self.start_date or self.end_date:
+            parts.append(f"dates={self.start_date or '...'}..{self.end_date or '...'}")
+        return ' '.join(parts)
+
+    def __len__(self):
+        return len(self.keys)
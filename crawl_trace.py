@@ -0,0 +1,220 @@
+import argparse
+import glob
+import gzip
+import heapq
+import json
+import os
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from crawl_targets import CHART_URL_PATTERN, full_year
+
+TRACE_DIR = 'data/traces'
+
+
+class StageTimer:
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.stages = {}
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = round((now - self.last) * 1000, 1)
+        self.last = now
+
+    @property
+    def total_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+
+def url_decade(url):
+    match = CHART_URL_PATTERN.search(url)
+    return f"{full_year(int(match.group(1)))}s" if match else 'unknown'
+
+
+class CrawlTrace:
+    # Append-only gzip JSONL, one entry per fetch/parse attempt. Each process
+    # writes its own file, so workers never interleave inside a gzip member;
+    # entries are flushed in small batches to keep the compression ratio
+
+    def __init__(self, directory=TRACE_DIR, flush_every=20, flush_seconds=5.0):
+        self.directory = directory
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.file = None
+        self.path = None
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz"
+        self.path = os.path.join(self.directory, name)
+        self.file = gzip.open(self.path, 'at', encoding='utf-8')
+
+    def record(self, url, chart_type, outcome, chart_data, timer):
+        records = chart_data['records'] if chart_data else []
+        info = chart_data['chart_info'] if chart_data else {}
+        entry = {
+            'ts': datetime.now().isoformat(timespec='milliseconds'),
+            'url': url,
+            'chart_type': chart_type,
+            'status': outcome.get('status'),
+            'error': outcome.get('error'),
+            'extractor': info.get('extractor'),
+            'records': len(records),
+            'missing_artist': sum(1 for r in records if r.get('artist') in (None, '', '[]', [])),
+            'date_source': info.get('date_source'),
+            'timings_ms': timer.stages,
+            'total_ms': timer.total_ms,
+        }
+        if self.file is None:
+            self.open()
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if self.file is not None and self.unflushed:
+            self.file.flush()
+            self.unflushed = 0
+            self.last_flush = time.monotonic()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_trace_entries(paths):
+    # Streams entries file by file; a trace cut off by a crash ends at its last
+    # complete line instead of failing the whole replay
+    for path in paths:
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+            print(f"{path}: truncated trace ({e.__class__.__name__}), using the entries before it")
+
+
+class TraceReport:
+    # Bounded aggregates: per-decade and per-error counters plus a top-N heap,
+    # so memory does not grow with the number of entries replayed
+
+    def __init__(self, top=20, few_records=10):
+        self.top = top
+        self.few_records = few_records
+        self.entries = 0
+        self.slowest = []
+        self.stage_totals = Counter()
+        self.extractors = defaultdict(Counter)
+        self.date_sources = defaultdict(Counter)
+        self.few = Counter()
+        self.missing_artist = Counter()
+        self.errors = Counter()
+        self.error_decades = defaultdict(Counter)
+        self.error_urls = Counter()
+        self.first_ts = None
+        self.last_ts = None
+
+    def add(self, entry):
+        self.entries += 1
+        url = entry.get('url', '')
+        decade = url_decade(url)
+        key = (entry.get('chart_type'), decade)
+        ts = entry.get('ts')
+        if ts:
+            self.first_ts = min(self.first_ts or ts, ts)
+            self.last_ts = max(self.last_ts or ts, ts)
+
+        item = (entry.get('total_ms') or 0, url)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, item)
+        elif item > self.slowest[0]:
+            heapq.heapreplace(self.slowest, item)
+        self.stage_totals.update(entry.get('timings_ms') or {})
+
+        error = entry.get('error') or (f"HTTP {entry['status']}" if (entry.get('status') or 0) >= 400 else None)
+        if error:
+            self.errors[error] += 1
+            self.error_decades[decade][error] += 1
+            self.error_urls[url] += 1
+            return
+        self.extractors[key][entry.get('extractor') or 'none'] += 1
+        self.date_sources[key][entry.get('date_source') or 'none'] += 1
+        if entry.get('records', 0) < self.few_records:
+            self.few[key] += 1
+        if entry.get('missing_artist'):
+            self.missing_artist[key] += 1
+
+    def print(self):
+        print(f"Trace entries: {self.entries} ({self.first_ts} .. {self.last_ts})")
+        if not self.entries:
+            return
+
+        print(f"\nSlowest {len(self.slowest)} attempts:")
+        for total_ms, url in sorted(self.slowest, reverse=True):
+            print(f"  {total_ms:>9.1f} ms  {url}")
+        print("\nTime per stage:")
+        for stage, total in self.stage_totals.most_common():
+            print(f"  {stage:<12} {total / 1000:>9.1f} s")
+
+        print("\nExtractors, date sources and thin charts by decade:")
+        thin = f"<{self.few_records} rec"
+        print(f"  {'type':<5} {'decade':<7} {'parsed':>7} {'fallback':>9} {'approx date':>11} {thin:>8} "
+              f"{'no artist':>9}  extractors")
+        for key in sorted(self.extractors, key=lambda k: (k[0] or '', k[1])):
+            parsed = sum(self.extractors[key].values())
+            # 'stream' is the table extractor run incrementally
+            fallback = parsed - self.extractors[key]['table'] - self.extractors[key]['stream']
+            # Rule and URL dates are weekday arithmetic, not read from the page
+            approx_dates = self.date_sources[key]['url'] + self.date_sources[key]['rule']
+            mix = ', '.join(f"{name} {count}" for name, count in self.extractors[key].most_common())
+            print(f"  {key[0] or '?':<5} {key[1]:<7} {parsed:>7} {fallback / parsed:>9.1%} {approx_dates / parsed:>11.1%} "
+                  f"{self.few[key]:>8} {self.missing_artist[key]:>9}  {mix}")
+
+        if self.errors:
+            print("\nErrors:")
+            for error, count in self.errors.most_common(self.top):
+                print(f"  {count:>6}  {error}")
+            print("\nErrors by decade:")
+            for decade in sorted(self.error_decades):
+                counts = ', '.join(f"{error} {count}" for error, count in self.error_decades[decade].most_common(5))
+                print(f"  {decade:<7} {counts}")
+            print("\nURLs with the most errors:")
+            for url, count in self.error_urls.most_common(self.top):
+                print(f"  {count:>6}  {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate per-URL crawl traces")
+    parser.add_argument('paths', nargs='*', help=f"Trace files or directories (default: {TRACE_DIR})")
+    parser.add_argument('--since', default=None, help="Only entries at or after this ISO timestamp")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths or [TRACE_DIR]:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, '*.jsonl.gz'))))
+        else:
+            paths.append(path)
+
+    report = TraceReport(top=args.top)
+    for entry in read_trace_entries(paths):
+        if args.since and entry.get('ts', '') < args.since:
+            continue
+        report.add(entry)
+    print(f"Replayed {len(paths)} trace files")
+    report.print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class GroupCommitWriter:
+    # Finished charts go through a bounded queue to a single writer task, which
+    # commits them in groups (up to max_batch charts or max_wait seconds) on one
+    # dedicated thread so disk I/O never runs on the event loop. A full queue
+    # makes submit() wait, which holds back the fetchers until the disk catches up
+
+    def __init__(self, scraper, max_batch=25, max_wait=2.0, max_queue=None):
+        self.scraper = scraper
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(maxsize=max_queue or max_batch * 2)
+        # One thread: commits stay ordered and sqlite/file handles stay on it
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chart-writer')
+        self.task = None
+        self.stats = {'batches': 0, 'charts': 0, 'commit_seconds': 0.0, 'max_batch': 0, 'backpressure_waits': 0}
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    async def submit(self, url, chart_data):
+        if self.task is not None and self.task.done():
+            # The writer died; surface its exception instead of blocking forever
+            self.task.result()
+        if self.queue.full():
+            self.stats['backpressure_waits'] += 1
+        await self.queue.put((url, chart_data))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+
+            started = time.perf_counter()
+            await loop.run_in_executor(self.executor, self.commit, batch)
+            elapsed = time.perf_counter() - started
+            self.stats['batches'] += 1
+            self.stats['charts'] += len(batch)
+            self.stats['commit_seconds'] += elapsed
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+
+    def commit(self, batch):
+        try:
+            self.scraper.commit_batch(batch)
+        except Exception as e:
+            # Not journaled: marking the batch processed would lose its charts
+            print(f"Commit failed, {len(batch)} charts left for the next run: {e}")
+
+    async def close(self):
+        if self.task is None:
+            return
+        if not self.task.done():
+            await self.queue.put(None)
+        try:
+            await self.task
+        finally:
+            self.executor.shutdown(wait=True)
+            self.task = None
+        stats = self.stats
+        if stats['batches']:
+            print(f"Writer: {stats['charts']} charts in {stats['batches']} group commits "
+                  f"(largest {stats['max_batch']}, {stats['commit_seconds']:.2f}s on disk, "
+                  f"{stats['backpressure_waits']} backpressure waits)")
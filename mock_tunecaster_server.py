@@ -0,0 +1,301 @@
+import argparse
+import html
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from chart_streams import read_chart_stream
+from crawl_targets import CHART_PREFIX, chart_dates_of_year, decade_dir
+
+# Decade index pages on tunecaster.com and the chart links each one carries
+INDEX_PAGES = {
+    'chart0.html': [('pop', '00')],
+    'chart1.html': [('pop', '10'), ('rock', '10')],
+    'chart6.html': [('pop', '60')],
+    'chart7.html': [('pop', '70')],
+    'chart8.html': [('pop', '80')],
+    'chart9.html': [('pop', '90')],
+    'rock0.html': [('rock', '00')],
+    'rock8.html': [('rock', '80')],
+    'rock9.html': [('rock', '90')],
+}
+
+
+def chart_path(chart_type, year, week):
+    return f"charts/{decade_dir(year)}/{CHART_PREFIX[chart_type]}{year % 100:02d}{week:02d}.html"
+
+
+def render_chart_page(chart_type, chart_date, songs):
+    label = 'Rock' if chart_type == 'rock' else 'Pop'
+    heading = f"{label} Chart for {chart_date.strftime('%B')} {chart_date.day}, {chart_date.year}"
+    parts = [
+        f"<html><head><title>{heading}</title></head><body>",
+        f"<h2>{html.escape(heading)}</h2>",
+        '<table class="t2"><tr><td class="lastWeek">LW</td><td class="thisWeek">TW</td>'
+        '<td class="title20">Title</td></tr></table>',
+    ]
+    for rank, (title, artists) in enumerate(songs, 1):
+        parts.append(
+            f'<table class="t2"><tr><td class="lastWeek">-</td><td class="thisWeek">{rank}</td>'
+            f'<td class="title20"><a class="songLink" href="#">{html.escape(title)}</a></td></tr></table>'
+        )
+        links = ''.join(f'<a class="artistLink" href="#">{html.escape(a)}</a>' for a in artists)
+        parts.append(f'<table class="t2"><tr><td class="artist20">{links}</td></tr></table>')
+    parts.append("</body></html>")
+    return '\n'.join(parts)
+
+
+def render_index_page(name, chart_paths):
+    links = '\n'.join(f'<a href="/{path}">{os.path.basename(path)}</a><br>' for path in chart_paths)
+    return f"<html><head><title>{name}</title></head><body>\n{links}\n</body></html>"
+
+
+def load_song_pool(charts_file):
+    songs = []
+    try:
+        for chart in read_chart_stream(charts_file):
+            for record in chart.get('records', []):
+                artists = record['artist']
+                if isinstance(artists, str):
+                    artists = json.loads(artists)
+                songs.append((record['title'], artists))
+    except Exception as e:
+        print(f"Could not load song pool from {charts_file}: {e}")
+    return songs or [(f"Song {i}", [f"Artist {i}"]) for i in range(1, 41)]
+
+
+def build_corpus(corpus_dir, charts_file='data/charts_data.json', years=range(2000, 2011),
+                 chart_types=('rock', 'pop'), chart_length=40):
+    # Synthesizes a tunecaster-shaped site from the recorded chart records so the
+    # benchmark has a realistic number of pages without touching the real site
+    song_pool = load_song_pool(charts_file)
+    linked = {}
+    written = 0
+    offset = 0
+    for chart_type in chart_types:
+        for year in years:
+            for week, chart_date in chart_dates_of_year(year):
+                songs = [song_pool[(offset + i) % len(song_pool)] for i in range(chart_length)]
+                offset += 1
+                path = chart_path(chart_type, year, week)
+                full_path = os.path.join(corpus_dir, path)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                with open(full_path, 'w', encoding='utf-8') as f:
+                    f.write(render_chart_page(chart_type, chart_date, songs))
+                linked.setdefault((chart_type, decade_dir(year)), []).append(path)
+                written += 1
+
+    for name, sections in INDEX_PAGES.items():
+        paths = []
+        for key in sections:
+            paths.extend(linked.get(key, []))
+        with open(os.path.join(corpus_dir, name), 'w', encoding='utf-8') as f:
+            f.write(render_index_page(name, paths))
+
+    print(f"Built corpus: {written} chart pages, {len(INDEX_PAGES)} index pages in {corpus_dir}")
+    return written
+
+
+def record_corpus(urls, corpus_dir, delay=2):
+    # Captures real pages verbatim so the mock can replay the live markup
+    for url in urls:
+        path = urlparse(url).path.lstrip('/') or 'index.html'
+        full_path = os.path.join(corpus_dir, path)
+        try:
+            request = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+            with urllib.request.urlopen(request, timeout=30) as response:
+                body = response.read()
+            os.makedirs(os.path.dirname(full_path) or corpus_dir, exist_ok=True)
+            with open(full_path, 'wb') as f:
+                f.write(body)
+            print(f"Recorded {url} -> {full_path}")
+        except Exception as e:
+            print(f"Could not record {url}: {e}")
+        time.sleep(delay)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class MockTunecasterServer:
+    def __init__(self, corpus_dir, host='127.0.0.1', port=0, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, rate_limit=None, burst=None, retry_after=1, seed=None):
+        self.corpus_dir = corpus_dir
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.bucket = TokenBucket(rate_limit, burst or max(1, int(rate_limit))) if rate_limit else None
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'served': 0, 'errors': 0, 'throttled': 0, 'not_found': 0}
+        self.stats_lock = threading.Lock()
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond(head=False)
+
+            def respond(self, head):
+                server.count('requests')
+                delay = server.latency_ms + server.random.uniform(0, server.jitter_ms)
+                if delay:
+                    time.sleep(delay / 1000)
+
+                if server.bucket and not server.bucket.take():
+                    server.count('throttled')
+                    self.send_error_page(429, {'Retry-After': str(server.retry_after)}, head)
+                    return
+
+                if server.error_rate and server.random.random() < server.error_rate:
+                    server.count('errors')
+                    self.send_error_page(server.random.choice([500, 502, 503]), {}, head)
+                    return
+
+                path = urlparse(self.path).path.lstrip('/') or 'index.html'
+                corpus_root = os.path.abspath(server.corpus_dir)
+                full_path = os.path.normpath(os.path.join(corpus_root, path))
+                if not full_path.startswith(corpus_root + os.sep) or not os.path.isfile(full_path):
+                    server.count('not_found')
+                    self.send_error_page(404, {}, head)
+                    return
+
+                with open(full_path, 'rb') as f:
+                    body = f.read()
+                server.count('served')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+            def send_error_page(self, status, headers, head):
+                body = f"<html><body><h1>{status}</h1></body></html>".encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.corpus_dir = os.path.abspath(self.corpus_dir)
+        self.httpd = ThreadingHTTPServer((self.host, self.port), self.make_handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for tunecaster.com")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Build a synthetic corpus from recorded chart data")
+    build.add_argument('--corpus', default='benchmarks/corpus')
+    build.add_argument('--charts-file', default='data/charts_data.json')
+    build.add_argument('--from-year', type=int, default=2000)
+    build.add_argument('--to-year', type=int, default=2010)
+    build.add_argument('--chart-length', type=int, default=40)
+
+    record = subparsers.add_parser('record', help="Record real pages into the corpus")
+    record.add_argument('--corpus', default='benchmarks/corpus')
+    record.add_argument('--delay', type=float, default=2)
+    record.add_argument('urls', nargs='+')
+
+    serve = subparsers.add_parser('serve', help="Serve a corpus over HTTP")
+    serve.add_argument('--corpus', default='benchmarks/corpus')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--latency-ms', type=float, default=0)
+    serve.add_argument('--jitter-ms', type=float, default=0)
+    serve.add_argument('--error-rate', type=float, default=0.0)
+    serve.add_argument('--rate-limit', type=float, default=None, help="Requests per second before 429")
+    serve.add_argument('--burst', type=int, default=None)
+    serve.add_argument('--retry-after', type=int, default=1)
+    serve.add_argument('--seed', type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_corpus(args.corpus, args.charts_file, range(args.from_year, args.to_year + 1),
+                     chart_length=args.chart_length)
+    elif args.command == 'record':
+        record_corpus(args.urls, args.corpus, args.delay)
+    else:
+        server = MockTunecasterServer(
+            args.corpus, args.host, args.port, args.latency_ms, args.jitter_ms,
+            args.error_rate, args.rate_limit, args.burst, args.retry_after, args.seed
+        )
+        server.start()
+        print(f"Serving {server.corpus_dir} at {server.base_url}", flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            print(f"Server stats: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import asyncio
+import multiprocessing
+import queue
+import signal
+import sys
+import time
+from collections import deque
+
+from concurrency_control import is_backoff_outcome, parse_retry_after
+
+
+class SharedRateLimiter:
+    # Politeness limit shared by every worker process: request start times are
+    # handed out at most max_rps per second, and a Retry-After seen by any
+    # worker pauses all of them
+
+    def __init__(self, context, max_rps):
+        self.interval = 1.0 / max_rps if max_rps else 0.0
+        self.next_start = context.Value('d', 0.0)
+        self.paused_until = context.Value('d', 0.0)
+
+    def reserve(self):
+        with self.next_start.get_lock():
+            now = time.time()
+            start = max(now, self.next_start.value, self.paused_until.value)
+            self.next_start.value = start + self.interval
+        return max(0.0, start - now)
+
+    def pause(self, seconds):
+        with self.paused_until.get_lock():
+            self.paused_until.value = max(self.paused_until.value, time.time() + seconds)
+
+
+def worker_main(worker_id, base_url, data_dir, page_settle_ms, max_retries, verify_dates, use_trace,
+                stdout_to_stderr, task_queue, result_queue, control_queue, limiter, stop_event):
+    # The supervisor coordinates shutdown; Ctrl+C must not kill a worker mid-page
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if stdout_to_stderr:
+        # stdout carries the writer's NDJSON stream
+        sys.stdout = sys.stderr
+    asyncio.run(worker_loop(worker_id, base_url, data_dir, page_settle_ms, max_retries, verify_dates, use_trace,
+                            task_queue, result_queue, control_queue, limiter, stop_event))
+
+
+async def worker_loop(worker_id, base_url, data_dir, page_settle_ms, max_retries, verify_dates, use_trace,
+                      task_queue, result_queue, control_queue, limiter, stop_event):
+    from playwright.async_api import async_playwright
+    from tunecaster_charts_scraper import TuneCasterCompleteScraper
+
+    # Fetch and parse only: the manifest, index and aggregates are the writer's
+    scraper = TuneCasterCompleteScraper(base_url=base_url, data_dir=data_dir, fetch_only=True)
+    scraper.page_settle_ms = page_settle_ms
+    scraper.verify_dates = verify_dates
+    scraper.use_trace = use_trace
+
+    async with async_playwright() as p:
+        browser = None
+        page = None
+        try:
+            while not stop_event.is_set():
+                try:
+                    task = task_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if task is None:
+                    break
+                url, chart_type, attempt = task
+
+                # One browser per worker, relaunched if it died under us
+                if browser is None or not browser.is_connected():
+                    browser = await p.chromium.launch(headless=True)
+                    context = await browser.new_context(user_agent=scraper.user_agent)
+                    page = await context.new_page()
+
+                await asyncio.sleep(limiter.reserve())
+                outcome = {}
+                chart_data = await scraper.scrape_chart_with_page(page, url, chart_type, outcome)
+
+                retry_after = parse_retry_after(outcome.get('retry_after'))
+                if retry_after:
+                    limiter.pause(retry_after)
+
+                if (chart_data is None and attempt < max_retries and
+                        is_backoff_outcome(outcome.get('status'), outcome.get('error'))):
+                    # The supervisor puts it back at the end of the pending work
+                    control_queue.put(('requeued', worker_id, url))
+                    continue
+
+                result_queue.put((url, chart_data))
+                control_queue.put(('done', worker_id, url))
+        finally:
+            scraper.close()
+            if browser is not None:
+                await browser.close()
+
+
+def writer_main(base_url, data_dir, result_queue, max_batch=25, max_wait=2.0, ndjson=None):
+    # The only process that touches the progress journal, the data file, the
+    # digest manifest, the search index and the aggregates; results are group
+    # committed like the async crawl's writer task
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from tunecaster_charts_scraper import TuneCasterCompleteScraper
+
+    from chart_streams import NDJSONSink
+
+    scraper = TuneCasterCompleteScraper(base_url=base_url, data_dir=data_dir)
+    if ndjson:
+        scraper.ndjson_sink = NDJSONSink(ndjson, append=True)
+        if ndjson == '-':
+            sys.stdout = sys.stderr
+    scraper.load_progress()
+    written = 0
+    closing = False
+    while not closing:
+        item = result_queue.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_batch:
+            try:
+                item = result_queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                closing = True
+                break
+            batch.append(item)
+        try:
+            scraper.commit_batch(batch)
+        except Exception as e:
+            # Not journaled: marking the batch processed would lose its charts
+            print(f"Commit failed, {len(batch)} charts left for the next run: {e}")
+        written += len(batch)
+
+    if scraper.ndjson_sink:
+        scraper.ndjson_sink.close()
+    if scraper.all_chart_data:
+        scraper.print_final_summary()
+    print(f"Writer finished: {written} charts committed")
+
+
+class CrawlSupervisor:
+    def __init__(self, scraper, workers=4, max_rps=2.0, max_restarts=None):
+        self.scraper = scraper
+        self.workers = workers
+        self.max_rps = max_rps
+        self.max_restarts = max_restarts if max_restarts is not None else workers * 3
+        self.context = multiprocessing.get_context('spawn')
+
+        # Each worker gets one task at a time on its own queue, so the
+        # supervisor always knows which URL a worker holds
+        self.task_queues = {}
+        self.pending = deque()
+        # Bounded like the async crawl's writer queue: when the writer falls
+        # behind, workers block on put instead of filling memory with charts
+        self.result_queue = self.context.Queue(maxsize=2 * scraper.commit_batch_size)
+        self.control_queue = self.context.Queue()
+        self.stop_event = self.context.Event()
+        self.limiter = SharedRateLimiter(self.context, max_rps)
+
+        self.processes = {}
+        self.in_flight = {}
+        self.attempts = {}
+        self.finished = 0
+        self.restarts = 0
+        self.stopping = False
+        self.next_worker_id = 0
+
+    def start_worker(self):
+        worker_id = self.next_worker_id
+        self.next_worker_id += 1
+        self.task_queues[worker_id] = self.context.Queue()
+        process = self.context.Process(
+            target=worker_main,
+            args=(worker_id, self.scraper.base_url, self.scraper.data_dir, self.scraper.page_settle_ms,
+                  self.scraper.max_retries, self.scraper.verify_dates, self.scraper.use_trace,
+                  self.ndjson_path() == '-', self.task_queues[worker_id], self.result_queue, self.control_queue,
+                  self.limiter, self.stop_event),
+            name=f"crawl-worker-{worker_id}",
+        )
+        process.start()
+        self.processes[worker_id] = process
+        return worker_id
+
+    def ndjson_path(self):
+        # The writer opens its own sink; the one given to the main process stays unused
+        sink = self.scraper.ndjson_sink
+        return sink.path if sink else None
+
+    def request_stop(self, signum=None, frame=None):
+        if not self.stopping:
+            print("\nShutdown requested: workers finish their current page, then exit")
+        self.stopping = True
+        self.stop_event.set()
+
+    def pending_work(self):
+        self.scraper.load_progress()
+        work = []
+        for chart_type in self.scraper.chart_type_order:
+            urls = self.scraper.rock_urls if chart_type == 'rock' else self.scraper.pop_urls
+            work.extend((url, chart_type) for url in urls
+                        if self.scraper.refresh or url not in self.scraper.processed_urls)
+        return work
+
+    def run(self):
+        work = self.pending_work()
+        if not work:
+            print("Nothing to do: all selected charts are already processed")
+            return 0
+
+        for url, chart_type in work:
+            self.pending.append((url, chart_type, 0))
+            self.attempts[url] = 0
+
+        previous_handlers = {sig: signal.signal(sig, self.request_stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        writer = self.context.Process(
+            target=writer_main,
+            args=(self.scraper.base_url, self.scraper.data_dir, self.result_queue,
+                  self.scraper.commit_batch_size, self.scraper.commit_interval, self.ndjson_path()),
+            name="crawl-writer",
+        )
+        writer.start()
+        for _ in range(min(self.workers, len(work))):
+            self.start_worker()
+        print(f"Supervisor: {len(work)} charts, {len(self.processes)} workers, politeness {self.max_rps} req/s")
+
+        try:
+            while self.finished < len(work) and not self.stopping:
+                self.dispatch()
+                try:
+                    self.handle_event(*self.control_queue.get(timeout=1.0))
+                except queue.Empty:
+                    pass
+
+                self.recover_crashed_workers()
+                if not self.processes:
+                    print("Supervisor: no live workers left, stopping")
+                    break
+        finally:
+            self.shutdown(writer)
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
+
+        print(f"Supervisor: {self.finished}/{len(work)} charts finished, {self.restarts} worker restarts")
+        if self.finished < len(work):
+            print("Run again to resume the remaining charts")
+        return self.finished
+
+    def dispatch(self):
+        for worker_id, process in self.processes.items():
+            if not self.pending:
+                return
+            if worker_id not in self.in_flight and process.is_alive():
+                task = self.pending.popleft()
+                self.in_flight[worker_id] = task
+                self.task_queues[worker_id].put(task)
+
+    def handle_event(self, event, worker_id, url):
+        task = self.in_flight.get(worker_id)
+        # An event for a task the supervisor already took back (its worker was
+        # declared dead) is stale; the task has been dispatched again
+        if task is None or task[0] != url:
+            return
+        del self.in_flight[worker_id]
+        if event == 'requeued':
+            url, chart_type, attempt = task
+            self.pending.append((url, chart_type, attempt + 1))
+        elif event == 'done':
+            self.finished += 1
+            if self.finished % 25 == 0:
+                print(f"Supervisor: {self.finished} charts finished")
+
+    def recover_crashed_workers(self):
+        for worker_id, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            del self.processes[worker_id]
+            self.task_queues.pop(worker_id).cancel_join_thread()
+            task = self.in_flight.pop(worker_id, None)
+            if self.stopping or (process.exitcode == 0 and task is None):
+                continue
+
+            print(f"Worker {worker_id} died (exit code {process.exitcode})")
+            if task is not None:
+                url, chart_type, _ = task
+                self.attempts[url] += 1
+                if self.attempts[url] > self.scraper.max_retries:
+                    # Keeps a poison page from crashing workers forever
+                    print(f"Giving up on {url} after {self.attempts[url]} crashes")
+                    self.result_queue.put((url, None))
+                    self.finished += 1
+                else:
+                    self.pending.append((url, chart_type, self.attempts[url]))
+
+            if self.restarts < self.max_restarts:
+                self.restarts += 1
+                replacement = self.start_worker()
+                print(f"Started replacement worker {replacement}")
+
+    def shutdown(self, writer):
+        self.stop_event.set()
+        # Undispatched tasks are dropped; they are not in the progress journal and run next time
+        for worker_id in self.processes:
+            self.task_queues[worker_id].put(None)
+        for process in self.processes.values():
+            process.join(timeout=60)
+            if process.is_alive():
+                process.terminate()
+        # Workers are gone, so every result they produced is already queued
+        self.result_queue.put(None)
+        writer.join()
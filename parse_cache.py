@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import time
+
+PARSE_CACHE_FILE = 'data/parse_cache.sqlite'
+# Extraction steps whose outputs are cached, each under its own version
+CACHED_EXTRACTORS = ('extract_songs_from_html', 'extract_chart_date_from_page')
+# Eviction: entries older than MAX_AGE_DAYS go, then the oldest beyond MAX_ENTRIES
+MAX_ENTRIES = 50000
+MAX_AGE_DAYS = 180
+# Puts between eviction passes while the cache is open
+EVICT_EVERY = 1000
+
+
+def parser_version(version, uses=()):
+    # Declares the version of an extraction function and the helpers it calls
+    # directly; each helper declares its own. Bump it whenever the function's
+    # output can change
+    def decorate(function):
+        function.parser_version = version
+        function.parser_uses = tuple(uses)
+        return function
+    return decorate
+
+
+def extractor_versions(cls, names=CACHED_EXTRACTORS):
+    # 'extract_songs_from_html=2,clean_songs=1,...': an entry is stale once the
+    # function or any helper it reaches through `uses` is bumped. A helper
+    # without @parser_version is an error, not an unversioned dependency
+    versions = {}
+    for name in names:
+        parts = {}
+        pending = [name]
+        while pending:
+            helper = pending.pop()
+            if helper in parts:
+                continue
+            function = getattr(cls, helper)
+            if not hasattr(function, 'parser_version'):
+                raise TypeError(f"{cls.__name__}.{helper} is used by {name} but has no @parser_version")
+            parts[helper] = function.parser_version
+            pending.extend(function.parser_uses)
+        versions[name] = ','.join([f"{name}={parts.pop(name)}"] +
+                                  [f"{helper}={version}" for helper, version in sorted(parts.items())])
+    return versions
+
+
+def page_key(html_content):
+    return hashlib.blake2b(html_content.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+class ParseCache:
+    # Outputs of the extraction steps keyed by (page hash, extractor), stored
+    # with the extractor's version. Opening the cache drops the entries of
+    # extractors whose version changed, then evicts by age and size
+
+    def __init__(self, path=PARSE_CACHE_FILE, versions=None, max_entries=MAX_ENTRIES, max_age_days=MAX_AGE_DAYS):
+        self.path = path
+        self.versions = versions or {}
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self._db = None
+        self.puts = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(parses)")]
+            if columns and 'stored_at' not in columns:
+                # Written before eviction existed; it is only a cache
+                self._db.execute("DROP TABLE parses")
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS parses (
+                    page_hash TEXT NOT NULL,
+                    extractor TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    PRIMARY KEY (page_hash, extractor)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS parses_extractor ON parses (extractor, version);
+                CREATE INDEX IF NOT EXISTS parses_stored_at ON parses (stored_at);
+            ''')
+            for extractor, version in self.versions.items():
+                dropped = self._db.execute("DELETE FROM parses WHERE extractor = ? AND version != ?",
+                                           (extractor, version)).rowcount
+                if dropped:
+                    print(f"Parse cache: dropped {dropped} {extractor} entries from older versions")
+            self.evict()
+        return self._db
+
+    def evict(self):
+        # Age first, then the oldest entries beyond max_entries
+        evicted = 0
+        if self.max_age_days is not None:
+            cutoff = time.time() - self.max_age_days * 86400
+            evicted += self._db.execute("DELETE FROM parses WHERE stored_at < ?", (cutoff,)).rowcount
+        if self.max_entries is not None:
+            excess = self._db.execute("SELECT COUNT(*) FROM parses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                evicted += self._db.execute(
+                    "DELETE FROM parses WHERE (page_hash, extractor) IN "
+                    "(SELECT page_hash, extractor FROM parses ORDER BY stored_at LIMIT ?)",
+                    (excess,)).rowcount
+        self.stats['evicted'] += evicted
+        return evicted
+
+    def get(self, key, extractor):
+        # Returns (hit, output)
+        row = self.db.execute("SELECT output FROM parses WHERE page_hash = ? AND extractor = ? AND version = ?",
+                              (key, extractor, self.versions[extractor])).fetchone()
+        if row is None:
+            self.stats['misses'] += 1
+            return False, None
+        self.stats['hits'] += 1
+        return True, json.loads(row[0])
+
+    def put(self, key, extractor, output):
+        self.db.execute(
+            "INSERT OR REPLACE INTO parses (page_hash, extractor, version, output, stored_at) VALUES (?, ?, ?, ?, ?)",
+            (key, extractor, self.versions[extractor], json.dumps(output, ensure_ascii=False), time.time())
+        )
+        self.puts += 1
+        if self.puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def cached(self, key, extractor, compute):
+        # compute() only runs on a miss
+        hit, output = self.get(key, extractor)
+        if hit:
+            return output
+        output = compute()
+        self.put(key, extractor, output)
+        return output
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import Counter
+
+from crawl_targets import parse_chart_url
+
+INDEX_FILE = 'data/search_index.sqlite'
+
+
+def normalize_text(text):
+    # Folds the spelling variants the extractors produce: case, accents,
+    # punctuation, '&' vs 'and' and a leading article
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    text = text.replace('&', ' and ')
+    text = re.sub(r"['’`]", '', text)
+    text = re.sub(r'[^a-z0-9]+', ' ', text).strip()
+    return re.sub(r'^(the|a|an) ', '', text)
+
+
+def trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def record_artists(record):
+    artists = record.get('artist') or []
+    if isinstance(artists, str):
+        artists = json.loads(artists) if artists.startswith('[') else [artists]
+    return artists
+
+
+class SearchIndex:
+    # Trigram inverted index over normalized titles and artist names:
+    #   terms        one row per distinct (field, normalized text)
+    #   postings     trigram -> term
+    #   appearances  term -> chart record
+    # The connection is opened on first use so worker processes that never
+    # store a chart do not touch the file. Callers serialize access, so the
+    # crawl's writer thread may use a connection opened elsewhere
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS terms (
+                    id INTEGER PRIMARY KEY,
+                    field TEXT NOT NULL,
+                    normalized TEXT NOT NULL,
+                    display TEXT NOT NULL,
+                    grams INTEGER NOT NULL,
+                    UNIQUE (field, normalized)
+                );
+                CREATE TABLE IF NOT EXISTS postings (
+                    trigram TEXT NOT NULL,
+                    term_id INTEGER NOT NULL,
+                    PRIMARY KEY (trigram, term_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS records (
+                    id TEXT PRIMARY KEY,
+                    chart_type TEXT NOT NULL,
+                    chart_date TEXT NOT NULL,
+                    rank INTEGER NOT NULL,
+                    title TEXT NOT NULL,
+                    artist TEXT NOT NULL,
+                    url TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS appearances (
+                    term_id INTEGER NOT NULL,
+                    record_id TEXT NOT NULL,
+                    PRIMARY KEY (term_id, record_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS appearances_record ON appearances (record_id);
+                CREATE INDEX IF NOT EXISTS records_url ON records (url);
+            ''')
+        return self._db
+
+    def term_id(self, field, text):
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+        row = self.db.execute("SELECT id FROM terms WHERE field = ? AND normalized = ?",
+                              (field, normalized)).fetchone()
+        if row:
+            return row[0]
+        grams = trigrams(normalized)
+        term_id = self.db.execute(
+            "INSERT INTO terms (field, normalized, display, grams) VALUES (?, ?, ?, ?)",
+            (field, normalized, text, len(grams))
+        ).lastrowid
+        self.db.executemany("INSERT INTO postings (trigram, term_id) VALUES (?, ?)",
+                            [(gram, term_id) for gram in grams])
+        return term_id
+
+    def add_chart(self, chart_data):
+        # One transaction per chart; a re-scraped chart replaces its old rows
+        info = chart_data['chart_info']
+        code = (parse_chart_url(info['url']) or (info['chart_type'], '0000'))[1]
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            # Rows of the previous version go first, so ranks it no longer has do not linger
+            self.db.execute("DELETE FROM appearances WHERE record_id IN (SELECT id FROM records WHERE url = ?)",
+                            (info['url'],))
+            self.db.execute("DELETE FROM records WHERE url = ?", (info['url'],))
+            for record in chart_data['records']:
+                artists = record_artists(record)
+                record_id = record.get('id') or f"{info['chart_type']}_{code}_{int(record['rank']):03d}"
+                # The same id may still be stored under another URL
+                self.db.execute("DELETE FROM appearances WHERE record_id = ?", (record_id,))
+                self.db.execute(
+                    "INSERT OR REPLACE INTO records (id, chart_type, chart_date, rank, title, artist, url) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (record_id, info['chart_type'], record.get('chart_date') or info['chart_date'],
+                     int(record['rank']), record['title'], json.dumps(artists, ensure_ascii=False),
+                     record.get('url') or info['url'])
+                )
+                term_ids = {self.term_id('title', record['title'])}
+                term_ids.update(self.term_id('artist', artist) for artist in artists)
+                self.db.executemany("INSERT OR IGNORE INTO appearances (term_id, record_id) VALUES (?, ?)",
+                                    [(term_id, record_id) for term_id in term_ids if term_id is not None])
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def match_terms(self, query, field=None, min_score=0.45, limit=20):
+        # Dice similarity over trigram sets: 2 * shared / (query grams + term grams)
+        grams = trigrams(normalize_text(query))
+        if not grams:
+            return []
+        placeholders = ','.join('?' * len(grams))
+        shared = Counter(dict(self.db.execute(
+            f"SELECT term_id, COUNT(*) FROM postings WHERE trigram IN ({placeholders}) GROUP BY term_id",
+            list(grams)
+        ).fetchall()))
+        # A term can only reach min_score if it shares at least this many grams
+        needed = min_score * len(grams) / 2
+        candidates = [term_id for term_id, count in shared.items() if count >= needed]
+        scored = []
+        for start in range(0, len(candidates), 500):
+            chunk = candidates[start:start + 500]
+            sql = f"SELECT id, field, display, grams FROM terms WHERE id IN ({','.join('?' * len(chunk))})"
+            params = chunk
+            if field:
+                sql += " AND field = ?"
+                params = chunk + [field]
+            for term_id, term_field, display, term_grams in self.db.execute(sql, params):
+                score = 2 * shared[term_id] / (len(grams) + term_grams)
+                if score >= min_score:
+                    scored.append((score, term_id, term_field, display))
+        scored.sort(key=lambda item: (-item[0], item[3]))
+        return scored[:limit]
+
+    def search(self, query, field=None, chart_type=None, min_score=0.45, limit=100):
+        # Returns hits ranked by match score, then chart date and rank
+        terms = self.match_terms(query, field, min_score)
+        hits, seen = [], set()
+        for score, term_id, term_field, display in terms:
+            sql = ("SELECT r.id, r.chart_type, r.chart_date, r.rank, r.title, r.artist FROM appearances a "
+                   "JOIN records r ON r.id = a.record_id WHERE a.term_id = ?")
+            params = [term_id]
+            if chart_type:
+                sql += " AND r.chart_type = ?"
+                params.append(chart_type)
+            sql += " ORDER BY r.chart_date, r.rank"
+            for record_id, row_type, chart_date, rank, title, artist in self.db.execute(sql, params):
+                if record_id in seen:
+                    continue
+                seen.add(record_id)
+                hits.append({
+                    'chart_type': row_type, 'chart_date': chart_date, 'rank': rank, 'score': round(score, 3),
+                    'matched': term_field, 'title': title, 'artist': json.loads(artist),
+                })
+                if len(hits) >= limit:
+                    return hits
+        return hits
+
+    def counts(self):
+        return {table: self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('records', 'terms', 'postings')}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def format_hit(hit):
+    return (f"{hit['score']:.2f}  {hit['chart_type']:<5} {hit['chart_date']}  #{hit['rank']:<3} "
+            f"{hit['title']} - {', '.join(hit['artist'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzzy title and artist search over collected charts")
+    parser.add_argument('--index', default=INDEX_FILE)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="Index charts already collected")
+    build.add_argument('sources', nargs='+', help="charts_data.csv, legacy JSON or NDJSON files")
+    query = subparsers.add_parser('query', help="Ranked fuzzy lookup")
+    query.add_argument('text')
+    query.add_argument('--field', choices=['title', 'artist'], default=None)
+    query.add_argument('--chart-type', default=None)
+    query.add_argument('--min-score', type=float, default=0.45)
+    query.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    from chart_digests import read_charts
+    index = SearchIndex(args.index)
+    try:
+        if args.command == 'build':
+            started = time.perf_counter()
+            charts = 0
+            for path in args.sources:
+                for chart in read_charts(path):
+                    index.add_chart(chart)
+                    charts += 1
+            counts = index.counts()
+            print(f"Indexed {charts} charts in {time.perf_counter() - started:.1f}s: "
+                  f"{counts['records']} records, {counts['terms']} terms, {counts['postings']} postings")
+        else:
+            started = time.perf_counter()
+            hits = index.search(args.text, args.field, args.chart_type, args.min_score, args.limit)
+            elapsed = (time.perf_counter() - started) * 1000
+            for hit in hits:
+                print(format_hit(hit))
+            print(f"{len(hits)} hits in {elapsed:.1f} ms")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
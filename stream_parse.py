@@ -0,0 +1,124 @@
+import codecs
+import time
+import urllib.error
+import urllib.request
+from html.parser import HTMLParser
+
+CHUNK_SIZE = 16384
+TITLE_CLASSES = {'title20', 'titleBoth20'}
+
+
+class ChartRowParser(HTMLParser):
+    # Incremental version of the table extractor: a row is emitted as soon as
+    # its artist20 cell closes (a row whose artist never comes is emitted when
+    # the next thisWeek cell opens). The chart is complete when the document
+    # body closes; a chart's length is not a reliable end, since a week can
+    # have more rows than the last one of its type
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        # Markup before the first row, where the chart heading and date are
+        self.head = []
+        self.seen_row = False
+        self.cell = None
+        self.cell_text = []
+        self.links = []
+        self.link = None
+        self.rank = None
+        self.title = None
+        self.complete = False
+
+    def feed(self, data):
+        if not self.seen_row:
+            self.head.append(data)
+        super().feed(data)
+
+    def close(self):
+        super().close()
+        self.flush_row()
+
+    def handle_starttag(self, tag, attrs):
+        classes = set((dict(attrs).get('class') or '').split())
+        if tag == 'td' and self.cell is None:
+            if 'thisWeek' in classes:
+                self.cell = 'rank'
+            elif classes & TITLE_CLASSES:
+                self.cell = 'title'
+            elif 'artist20' in classes:
+                self.cell = 'artist'
+            self.cell_text, self.links = [], []
+        elif tag == 'a' and self.cell and classes & {'songLink', 'artistLink'}:
+            self.link = []
+
+    def handle_endtag(self, tag):
+        if tag in ('body', 'html'):
+            self.flush_row()
+            self.complete = True
+        elif tag == 'a' and self.link is not None:
+            self.links.append(' '.join(''.join(self.link).split()))
+            self.link = None
+        elif tag == 'td' and self.cell is not None:
+            cell, self.cell = self.cell, None
+            self.end_cell(cell, ' '.join(''.join(self.cell_text).split()))
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell_text.append(data)
+            if self.link is not None:
+                self.link.append(data)
+
+    def end_cell(self, cell, text):
+        if cell == 'rank':
+            if text.isdigit():
+                self.flush_row()
+                self.rank, self.title = int(text), None
+                self.seen_row = True
+        elif cell == 'title':
+            if self.rank is not None and self.title is None:
+                self.title = self.links[0] if self.links else text
+        elif self.rank is not None and self.title:
+            names = [name for name in self.links if len(name) > 1]
+            self.emit(' with '.join(names) if names else text)
+
+    def flush_row(self):
+        if self.rank is not None and self.title:
+            self.emit('')
+
+    def emit(self, artist):
+        row = {'position': self.rank, 'title': self.title, 'artist': artist}
+        self.rows.append(row)
+        self.rank, self.title = None, None
+
+
+def fetch_chart_rows(url, user_agent, timeout=30, chunk_size=CHUNK_SIZE):
+    # Blocking; run it in an executor. Chunks are parsed as they arrive, so
+    # parse time overlaps the transfer and only one chunk of the page is held
+    # at a time. Reading stops at EOF or once the body has closed
+    parser = ChartRowParser()
+    result = {'status': None, 'retry_after': None, 'rows': parser.rows, 'head': '',
+              'bytes': 0, 'first_byte_ms': None}
+    started = time.perf_counter()
+    request = urllib.request.Request(url, headers={'User-Agent': user_agent})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            result['status'] = response.status
+            result['first_byte_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            charset = response.headers.get_content_charset() or 'utf-8'
+            decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+            while True:
+                chunk = response.read1(chunk_size)
+                if not chunk:
+                    parser.feed(decoder.decode(b'', final=True))
+                    break
+                result['bytes'] += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.complete:
+                    break
+    except urllib.error.HTTPError as e:
+        result['status'] = e.code
+        result['retry_after'] = e.headers.get('Retry-After')
+        return result
+    parser.close()
+    result['head'] = ''.join(parser.head)
+    return result
@@ -1,20 +1,142 @@
-import asyncio
 import json
 import re
 import os
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
+import sys
+import time
+from collections import deque
 from datetime import datetime
 from urllib.parse import urljoin
+from concurrency_control import AIMDConcurrencyController, is_backoff_outcome
+from crawl_targets import CrawlTarget, chart_url, full_year, parse_chart_url
+from parse_cache import parser_version
+from tunecaster_cli import build_target, parse_args
+# The calendar, digest, index, aggregate, stream, trace and cache modules are
+# imported where they are used; the command line lives in tunecaster_cli.py
 
 class TuneCasterCompleteScraper:
-    def __init__(self):
-        self.base_url = "https://tunecaster.com"
+    def __init__(self, base_url="https://tunecaster.com", data_dir='data', max_concurrency=4, fetch_only=False):
+        self.base_url = base_url.rstrip('/')
+        self.data_dir = data_dir
+        # Crawl worker processes only fetch and parse; the stores below belong
+        # to the one process that commits results
+        self.fetch_only = fetch_only
         self.pop_urls = []
         self.rock_urls = []
         self.all_chart_data = []
-        self.progress_file = 'data/scraper_progress.json'
+        self.progress_file = os.path.join(data_dir, 'scraper_progress.json')
+        self.data_file = os.path.join(data_dir, 'charts_data.csv')
+        # Date and date source of every stored chart, read by chart_calendar.py
+        self.date_log_file = os.path.join(data_dir, 'chart_dates.jsonl')
         self.processed_urls = set()
+        # Size of the data file as of the last committed progress journal
+        self.data_offset = None
+        self.chart_type_order = ['rock', 'pop']
+        self.target = None
+        # Calendar, digests, search index, aggregates, parse cache and trace
+        # are properties built on first use; see the properties below
+        self._calendar = None
+        self._digests = None
+        self._search_index = None
+        self._aggregates = None
+        self._parse_cache = None
+        self._trace = None
+        self.verify_dates = False
+        self.refresh = False
+        self.unchanged_charts = 0
+        # False parses every page from scratch instead of reusing cached outputs
+        self.use_parse_cache = True
+        # False skips the crawl trace, see --no-trace
+        self.use_trace = True
+        # Optional extra output: one chart per line, see --ndjson
+        self.ndjson_sink = None
+        # Politeness delays (seconds) and post-load settle time (ms); the
+        # benchmark turns these down when running against the local mock server
+        self.discovery_delay = 1
+        # Probing the arithmetic URL space; results are kept across runs
+        self.probe_file = os.path.join(data_dir, 'url_probes.jsonl')
+        self.probe_delay = 0.5
+        self.request_delay = 2
+        self.page_settle_ms = 3000
+        self.user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        # Parallelism adapts between 1 and max_concurrency based on latency,
+        # errors and throttling; throttled URLs are retried instead of dropped
+        self.concurrency = AIMDConcurrencyController(min_limit=1, max_limit=max_concurrency)
+        self.max_retries = 3
+        # Static chart pages can be fetched over plain HTTP and parsed while they stream in
+        self.stream_pages = False
+        # Finished charts are committed in groups by a writer task during a crawl
+        self.commit_batch_size = 25
+        self.commit_interval = 2.0
+        self.writer = None
+    
+    @property
+    def calendar(self):
+        # Exact YYWW -> date table; see resolve_chart_date for when pages are
+        # still scanned for their date
+        if self._calendar is None:
+            from chart_calendar import ChartCalendar
+            self._calendar = ChartCalendar.load()
+        return self._calendar
+    
+    def require_store(self, name):
+        if self.fetch_only:
+            raise RuntimeError(f"A fetch-only scraper has no {name}; results are committed by the writer")
+    
+    @property
+    def digests(self):
+        # Content digests of stored charts; re-scrapes with identical content
+        # are dropped before any serialization or file I/O
+        if self._digests is None:
+            self.require_store('digest manifest')
+            from chart_digests import DigestManifest
+            self._digests = DigestManifest(os.path.join(self.data_dir, 'chart_digests.jsonl'),
+                                           os.path.join(self.data_dir, 'chart_changes.jsonl'))
+        return self._digests
+    
+    @property
+    def search_index(self):
+        # Fuzzy title/artist lookup, kept current as charts are stored
+        if self._search_index is None:
+            self.require_store('search index')
+            from search_index import SearchIndex
+            self._search_index = SearchIndex(os.path.join(self.data_dir, 'search_index.sqlite'))
+        return self._search_index
+    
+    @property
+    def aggregates(self):
+        if self._aggregates is None:
+            self.require_store('aggregates')
+            from chart_aggregates import ChartAggregates
+            self._aggregates = ChartAggregates(os.path.join(self.data_dir, 'chart_aggregates.sqlite'))
+        return self._aggregates
+    
+    @property
+    def parse_cache(self):
+        # Extractor outputs by page hash; None when use_parse_cache is off
+        if not self.use_parse_cache:
+            return None
+        if self._parse_cache is None:
+            from parse_cache import ParseCache, extractor_versions
+            self._parse_cache = ParseCache(os.path.join(self.data_dir, 'parse_cache.sqlite'),
+                                           extractor_versions(type(self)))
+        return self._parse_cache
+    
+    @property
+    def trace(self):
+        # One trace entry per fetch/parse attempt; the file is created on first
+        # use. None when use_trace is off
+        if not self.use_trace:
+            return None
+        if self._trace is None:
+            from crawl_trace import CrawlTrace
+            self._trace = CrawlTrace(os.path.join(self.data_dir, 'traces'))
+        return self._trace
+    
+    def close(self):
+        # Closes the stores this run actually opened
+        for store in (self._trace, self._parse_cache, self._search_index):
+            if store is not None:
+                store.close()
     
     def load_progress(self):
         if os.path.exists(self.progress_file):
@@ -22,23 +144,43 @@ class TuneCasterCompleteScraper:
                 with open(self.progress_file, 'r', encoding='utf-8') as f:
                     progress = json.load(f)
                     self.processed_urls = set(progress.get('processed_urls', []))
+                    self.data_offset = progress.get('data_offset')
                     print(f"Loaded progress: {len(self.processed_urls)} URLs already processed")
-                    return True
+                self.recover_data_file()
+                return True
             except Exception as e:
                 print(f"Could not load progress: {e}")
         return False
     
+    def recover_data_file(self):
+        # Rows appended after the last committed journal belong to a group commit
+        # that never finished; cutting them keeps data and progress in step
+        if self.data_offset is None or not os.path.exists(self.data_file):
+            return
+        size = os.path.getsize(self.data_file)
+        if size > self.data_offset:
+            with open(self.data_file, 'r+b') as f:
+                f.truncate(self.data_offset)
+            print(f"Rolled back {size - self.data_offset} bytes of uncommitted rows in {self.data_file}")
+    
     def save_progress(self, current_url):
+        self.processed_urls.add(current_url)
+        self.write_progress(current_url)
+    
+    def write_progress(self, last_url):
+        # Written to a temp file and renamed, so the journal is replaced atomically
         try:
-            os.makedirs('data', exist_ok=True)
-            self.processed_urls.add(current_url)
+            os.makedirs(self.data_dir, exist_ok=True)
             progress = {
                 'processed_urls': list(self.processed_urls),
-                'last_processed': current_url,
-                'timestamp': datetime.now().isoformat()
+                'last_processed': last_url,
+                'timestamp': datetime.now().isoformat(),
+                'data_offset': self.data_offset,
             }
-            with open(self.progress_file, 'w', encoding='utf-8') as f:
+            tmp_path = self.progress_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(progress, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.progress_file)
         except Exception as e:
             print(f"Could not save progress: {e}")
     
@@ -47,21 +189,23 @@ class TuneCasterCompleteScraper:
         
         decade_pages = {
             'pop': [
-                'https://tunecaster.com/chart0.html',
-                'https://tunecaster.com/chart1.html',
-                'https://tunecaster.com/chart6.html',
-                'https://tunecaster.com/chart7.html',  
-                'https://tunecaster.com/chart8.html',
-                'https://tunecaster.com/chart9.html',
+                f'{self.base_url}/chart0.html',
+                f'{self.base_url}/chart1.html',
+                f'{self.base_url}/chart6.html',
+                f'{self.base_url}/chart7.html',
+                f'{self.base_url}/chart8.html',
+                f'{self.base_url}/chart9.html',
             ],
             'rock': [
-                'https://tunecaster.com/chart1.html',
-                'https://tunecaster.com/rock0.html',
-                'https://tunecaster.com/rock8.html',
-                'https://tunecaster.com/rock9.html', 
+                f'{self.base_url}/chart1.html',
+                f'{self.base_url}/rock0.html',
+                f'{self.base_url}/rock8.html',
+                f'{self.base_url}/rock9.html',
             ]
         }
         
+        import asyncio
+        from playwright.async_api import async_playwright
         async with async_playwright() as p:
             browser = await p.chromium.launch(headless=True)
             context = await browser.new_context()
@@ -78,7 +222,7 @@ class TuneCasterCompleteScraper:
                     if pop_2010_urls:
                         print(f"  -> {len(pop_2010_urls)} URLs for 2010 from {decade_url}")
                     
-                    await asyncio.sleep(1)
+                    await asyncio.sleep(self.discovery_delay)
                 
                 print("Discovering Rock chart URLs...")
                 for decade_url in decade_pages['rock']:
@@ -90,7 +234,7 @@ class TuneCasterCompleteScraper:
                     if rock_2010_urls:
                         print(f"  -> {len(rock_2010_urls)} URLs for 2010 from {decade_url}")
                     
-                    await asyncio.sleep(1)
+                    await asyncio.sleep(self.discovery_delay)
                 
             finally:
                 await browser.close()
@@ -99,33 +243,9 @@ class TuneCasterCompleteScraper:
         self.pop_urls = list(set(self.pop_urls))
         self.rock_urls = list(set(self.rock_urls))
         
-        # Sort pop URLs to prioritize 2010s (decade 10) first
-        def sort_pop_urls(url):
-            match = re.search(r'/charts/(\d{2})/week(\d{4})\.html', url)
-            if match:
-                decade = int(match.group(1))
-                week = match.group(2)
-                if decade == 10:
-                    return (0, decade, week)  # 2010s first
-                else:
-                    return (1, decade, week)  # Other decades after
-            return (2, 99, "9999")  # Invalid URLs last
-        
-        self.pop_urls = sorted(self.pop_urls, key=sort_pop_urls)
-        
-        # Sort rock URLs to prioritize 2010s (decade 10) first
-        def sort_rock_urls(url):
-            match = re.search(r'/charts/(\d{2})/rock(\d{4})\.html', url)
-            if match:
-                decade = int(match.group(1))
-                week = match.group(2)
-                if decade == 10:
-                    return (0, decade, week)  # 2010s first
-                else:
-                    return (1, decade, week)  # Other decades after
-            return (2, 99, "9999")  # Invalid URLs last
-        
-        self.rock_urls = sorted(self.rock_urls, key=sort_rock_urls)
+        # Sort URLs to prioritize 2010s (decade 10) first
+        self.pop_urls = sorted(self.pop_urls, key=self.url_priority)
+        self.rock_urls = sorted(self.rock_urls, key=self.url_priority)
         
         # Show 2010 URLs count for both pop and rock
         pop_2010_urls = [url for url in self.pop_urls if '/charts/10/' in url]
@@ -158,6 +278,71 @@ class TuneCasterCompleteScraper:
         print(f"1. ALL ROCK CHARTS ({len(self.rock_urls)}) - 2010 first")
         print(f"2. ALL POP CHARTS ({len(self.pop_urls)}) - 2010 first")
     
+    @staticmethod
+    def url_priority(url):
+        match = re.search(r'/charts/(\d{2})/(?:week|rock)(\d{4})\.html', url)
+        if match:
+            decade = int(match.group(1))
+            week = match.group(2)
+            if decade == 10:
+                return (0, decade, week)  # 2010s first
+            else:
+                return (1, decade, week)  # Other decades after
+        return (2, 99, "9999")  # Invalid URLs last
+    
+    async def probe_chart_urls(self, target=None):
+        # Generates every YYWW URL of the selected years, checks the ones not
+        # probed before and merges the hits with any index page links
+        from url_probe import ProbeLog, URLProber, candidate_urls
+        target = target or CrawlTarget(chart_types=self.chart_type_order)
+        prober = URLProber(self.concurrency, ProbeLog(self.probe_file), self.user_agent,
+                           self.probe_delay, self.max_retries)
+        print("Probing chart URLs...")
+        for chart_type in target.chart_types:
+            urls = self.rock_urls if chart_type == 'rock' else self.pop_urls
+            linked = set(urls)
+            candidates = [url for url in candidate_urls(self.base_url, chart_type, target.years(chart_type))
+                          if url not in linked]
+            found = await prober.probe(candidates)
+            urls.extend(found)
+            urls.sort(key=self.url_priority)
+            print(f"{chart_type.capitalize()}: {len(candidates)} candidates not linked from an index page, "
+                  f"{len(found)} exist")
+        print(f"Probe results: {prober.stats}")
+    
+    def apply_target(self, target, discovered=False):
+        # Schedules exactly the charts selected by a CrawlTarget. With discovered=True
+        # the already discovered URL lists are filtered instead of computed from YYWW codes
+        self.target = target
+        self.chart_type_order = list(target.chart_types)
+        if discovered:
+            self.rock_urls = [url for url in self.rock_urls if target.matches(url)]
+            self.pop_urls = [url for url in self.pop_urls if target.matches(url)]
+        else:
+            urls = target.chart_urls(self.base_url)
+            self.rock_urls = urls.get('rock', [])
+            self.pop_urls = urls.get('pop', [])
+        
+        print(f"\nTARGETED CRAWL: {target.describe()}")
+        print(f"Rock Charts: {len(self.rock_urls)}")
+        print(f"Pop Charts: {len(self.pop_urls)}")
+        print(f"Total Charts: {len(self.rock_urls) + len(self.pop_urls)}")
+    
+    def apply_urls(self, urls):
+        # Schedules an explicit list of chart URLs, e.g. the validator's re-scrape list
+        selected = {'rock': [], 'pop': []}
+        for url in urls:
+            parsed = parse_chart_url(url)
+            if not parsed:
+                print(f"Not a chart URL, ignored: {url}")
+                continue
+            url = chart_url(self.base_url, *parsed)
+            if url not in selected[parsed[0]]:
+                selected[parsed[0]].append(url)
+        self.rock_urls = selected['rock']
+        self.pop_urls = selected['pop']
+        print(f"\nURL LIST CRAWL: {len(self.rock_urls)} rock, {len(self.pop_urls)} pop charts")
+    
     async def extract_urls_from_decade_page(self, page, decade_url, chart_type):
         urls = []
         try:
@@ -189,39 +374,118 @@ class TuneCasterCompleteScraper:
             return bool(re.search(r'/charts/[0-9]+/rock[0-9]+\.html', url))
         return False
     
-    async def scrape_single_chart(self, url, chart_type):
+    async def scrape_single_chart(self, url, chart_type, outcome=None):
+        if self.stream_pages:
+            if outcome is None:
+                outcome = {}
+            chart_data = await self.stream_chart(url, chart_type, outcome)
+            if chart_data and len(chart_data['records']) >= 10:
+                return chart_data
+            if is_backoff_outcome(outcome.get('status'), outcome.get('error')):
+                return None
+            # Not a static chart page after all: load it the usual way
+            print(f"Streamed parse found {len(chart_data['records']) if chart_data else 0} records, "
+                  f"loading {url} in the browser")
+            outcome.clear()
+        
+        from playwright.async_api import async_playwright
         async with async_playwright() as p:
             browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            )
+            context = await browser.new_context(user_agent=self.user_agent)
             page = await context.new_page()
             
             try:
-                await page.goto(url, wait_until='networkidle', timeout=30000)
-                await page.wait_for_timeout(3000)
-                
-                html_content = await page.content()
-                chart_data = self.parse_chart(html_content, url, chart_type)
-                
-                if chart_data and len(chart_data['records']) < 10:
-                    chart_data = await self.parse_chart_alternative(page, url, chart_type)
-                
-                return chart_data
-                
-            except Exception as e:
-                print(f"Error scraping {url}: {e}")
-                return None
+                return await self.scrape_chart_with_page(page, url, chart_type, outcome)
             finally:
                 await browser.close()
     
+    async def stream_chart(self, url, chart_type, outcome):
+        # Plain HTTP fetch parsed while it downloads (stream_parse.py)
+        import asyncio
+        from stream_parse import fetch_chart_rows
+        from crawl_trace import StageTimer
+        timer = StageTimer()
+        chart_data = None
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, fetch_chart_rows, url, self.user_agent)
+            timer.lap('stream')
+            outcome['status'] = result['status']
+            outcome['retry_after'] = result['retry_after']
+            if result['status'] is None or result['status'] >= 400:
+                print(f"HTTP {result['status']} for {url}")
+                return None
+            songs = self.clean_songs([dict(row, extractor='stream') for row in result['rows']])
+            songs.sort(key=lambda x: x.get('position', 999))
+            
+            def page_date():
+                # Only the markup before the first row is kept; the heading is there
+                from bs4 import BeautifulSoup
+                return self.extract_chart_date_from_page(BeautifulSoup(result['head'], 'html.parser'))
+            
+            chart_date, date_source = self.resolve_chart_date(None, url, page_date=page_date)
+            if chart_date is None:
+                print(f"Skipping chart due to invalid date: {url}")
+                return None
+            chart_data = self.build_chart(songs, url, chart_type, chart_date, date_source)
+            timer.lap('parse')
+            return chart_data
+        
+        except Exception as e:
+            # urllib wraps socket timeouts; report them as timeouts so they back off
+            timed_out = isinstance(getattr(e, 'reason', e), TimeoutError)
+            outcome['error'] = 'TimeoutError' if timed_out else e.__class__.__name__
+            print(f"Error streaming {url}: {e}")
+            return None
+        
+        finally:
+            if self.trace:
+                self.trace.record(url, chart_type, outcome, chart_data, timer)
+    
+    async def scrape_chart_with_page(self, page, url, chart_type, outcome=None):
+        if outcome is None:
+            outcome = {}
+        from crawl_trace import StageTimer
+        timer = StageTimer()
+        chart_data = None
+        try:
+            response = await page.goto(url, wait_until='networkidle', timeout=30000)
+            timer.lap('fetch')
+            if response is not None:
+                outcome['status'] = response.status
+                outcome['retry_after'] = response.headers.get('retry-after')
+                if is_backoff_outcome(response.status):
+                    print(f"HTTP {response.status} for {url}")
+                    return None
+            await page.wait_for_timeout(self.page_settle_ms)
+            timer.lap('settle')
+            
+            html_content = await page.content()
+            timer.lap('content')
+            chart_data = self.parse_chart(html_content, url, chart_type)
+            timer.lap('parse')
+            
+            if chart_data and len(chart_data['records']) < 10:
+                chart_data = await self.parse_chart_alternative(page, url, chart_type)
+                timer.lap('alternative')
+            
+            return chart_data
+            
+        except Exception as e:
+            outcome['error'] = e.__class__.__name__
+            print(f"Error scraping {url}: {e}")
+            chart_data = None
+            return None
+        
+        finally:
+            if self.trace:
+                self.trace.record(url, chart_type, outcome, chart_data, timer)
+    
     async def parse_chart_alternative(self, page, url, chart_type):
+        from bs4 import BeautifulSoup
         html_content = await page.content()
         soup = BeautifulSoup(html_content, 'html.parser')
-        chart_date = self.extract_chart_date_from_page(soup)
-        
-        if chart_date is None:
-            chart_date = self.extract_chart_date_from_url(url)
+        chart_date, date_source = self.resolve_chart_date(soup, url)
             
         if chart_date is None:
             print(f"Skipping alternative parsing due to invalid date: {url}")
@@ -342,6 +606,8 @@ class TuneCasterCompleteScraper:
                     'chart_info': {
                         'chart_type': chart_type,
                         'chart_date': chart_date,
+                        'date_source': date_source,
+                        'extractor': 'alternative',
                         'url': url
                     },
                     'records': [
@@ -363,18 +629,33 @@ class TuneCasterCompleteScraper:
         return None
     
     def parse_chart(self, html_content, url, chart_type):
-        soup = BeautifulSoup(html_content, 'html.parser')
-        songs = self.extract_songs_from_html(soup)
+        soups = []
         
-        chart_date = self.extract_chart_date_from_page(soup)
+        def soup():
+            # Only built when an extractor actually runs
+            if not soups:
+                from bs4 import BeautifulSoup
+                soups.append(BeautifulSoup(html_content, 'html.parser'))
+            return soups[0]
         
-        if chart_date is None:
-            chart_date = self.extract_chart_date_from_url(url)
+        def extract(extractor, compute):
+            if self.parse_cache is None:
+                return compute()
+            return self.parse_cache.cached(key, extractor, compute)
+        
+        from parse_cache import page_key
+        key = page_key(html_content) if self.parse_cache is not None else None
+        songs = extract('extract_songs_from_html', lambda: self.extract_songs_from_html(soup()))
+        
+        chart_date, date_source = self.resolve_chart_date(None, url, page_date=lambda: extract(
+            'extract_chart_date_from_page', lambda: self.extract_chart_date_from_page(soup())))
             
         if chart_date is None:
             print(f"Skipping chart due to invalid date: {url}")
             return None
-            
+        return self.build_chart(songs, url, chart_type, chart_date, date_source)
+    
+    def build_chart(self, songs, url, chart_type, chart_date, date_source):
         records = []
         
         for song in songs:
@@ -388,29 +669,35 @@ class TuneCasterCompleteScraper:
             }
             records.append(record)
         
+        # Which extractor(s) produced the rows, for the crawl trace
+        extractor = '+'.join(sorted({song['extractor'] for song in songs if song.get('extractor')})) or 'none'
         return {
             'chart_info': {
                 'chart_type': chart_type,
                 'chart_date': chart_date,
+                'date_source': date_source,
+                'extractor': extractor,
                 'url': url
             },
             'records': records
         }
     
+    @parser_version(1, uses=('extract_using_table_structure', 'extract_using_sequential_parsing', 'clean_songs'))
     def extract_songs_from_html(self, soup):
         songs = []
-        songs.extend(self.extract_using_table_structure(soup))
+        songs.extend(dict(song, extractor='table') for song in self.extract_using_table_structure(soup))
         
         text_songs = self.extract_using_sequential_parsing(soup)
         for song in text_songs:
             if not any(s['position'] == song['position'] for s in songs):
-                songs.append(song)
+                songs.append(dict(song, extractor='sequential'))
         
         unique_songs = self.clean_songs(songs)
         unique_songs.sort(key=lambda x: x.get('position', 999))
         
         return unique_songs
     
+    @parser_version(1, uses=('extract_title_from_cell', 'find_artist_in_next_tables', 'parse_multiple_artists'))
     def extract_using_table_structure(self, soup):
         songs = []
         tables = soup.find_all('table', class_='t2')
@@ -447,6 +734,7 @@ class TuneCasterCompleteScraper:
         
         return songs
     
+    @parser_version(1, uses=('find_title_in_next_lines', 'find_artist_in_text_lines', 'parse_multiple_artists'))
     def extract_using_sequential_parsing(self, soup):
         songs = []
         page_text = soup.get_text()
@@ -525,6 +813,7 @@ class TuneCasterCompleteScraper:
         
         return songs
     
+    @parser_version(1)
     def find_title_in_next_lines(self, lines, start_index):
         for j in range(start_index, min(start_index + 3, len(lines))):
             if j >= len(lines):
@@ -547,6 +836,7 @@ class TuneCasterCompleteScraper:
         
         return ""
     
+    @parser_version(1)
     def find_artist_in_text_lines(self, lines, start_index):
         for j in range(start_index, min(start_index + 12, len(lines))):
             if j >= len(lines):
@@ -582,6 +872,7 @@ class TuneCasterCompleteScraper:
         
         return ""
     
+    @parser_version(1)
     def extract_chart_date_from_page(self, soup):
         try:
             month_names = {
@@ -728,30 +1019,42 @@ class TuneCasterCompleteScraper:
         
         return None
     
+    def resolve_chart_date(self, soup, url, page_date=None):
+        # page_date, if given, replaces scanning soup (e.g. a cached scan).
+        # Only calendar dates once seen on a page skip the scan; a 'rule'
+        # entry is the weekday arithmetic and only used if the page has no date
+        calendar_date, calendar_source = self.calendar.entry_for_url(url) or (None, None)
+        if calendar_source == 'page' and not self.verify_dates:
+            return calendar_date, 'calendar'
+        
+        page_date = page_date() if page_date else self.extract_chart_date_from_page(soup)
+        if page_date:
+            if calendar_date and page_date != calendar_date:
+                print(f"Date check: page says {page_date}, calendar ({calendar_source}) says {calendar_date} for {url}")
+            return page_date, 'page'
+        
+        if calendar_date:
+            return calendar_date, 'calendar' if calendar_source == 'page' else 'rule'
+        return self.extract_chart_date_from_url(url), 'url'
+    
     def extract_chart_date_from_url(self, url):
-        match = re.search(r'/charts/(\d{2})/(?:rock|week)(\d{4})\.html', url)
+        calendar_date = self.calendar.date_for_url(url)
+        if calendar_date:
+            return calendar_date
+        
+        match = re.search(r'/charts/(\d{2})/(rock|week)(\d{4})\.html', url)
         if match:
-            decade = int(match.group(1))
-            week_number = match.group(2)
-            year_suffix = int(week_number[:2])
+            chart_type = 'rock' if match.group(2) == 'rock' else 'pop'
+            week_number = match.group(3)
+            year = full_year(int(week_number[:2]))
             week = int(week_number[2:])
             
-            if decade >= 60 and decade <= 99:
-                full_year = 1900 + year_suffix
-            elif decade >= 0 and decade <= 20:
-                full_year = 2000 + year_suffix
-            else:
-                full_year = 1900 + year_suffix if year_suffix >= 60 else 2000 + year_suffix
-            
+            # Week N is the Nth chart day (Saturday unless the calendar says otherwise)
+            from chart_calendar import rule_date
             try:
-                import datetime
-                jan_1 = datetime.date(full_year, 1, 1)
-                days_to_monday = (7 - jan_1.weekday()) % 7
-                first_monday = jan_1 + datetime.timedelta(days=days_to_monday)
-                week_start = first_monday + datetime.timedelta(weeks=week-1)
-                return week_start.strftime('%Y-%m-%d')
+                return rule_date(year, week, self.calendar.weekday(chart_type, year)).strftime('%Y-%m-%d')
             except (ValueError, OverflowError):
-                return f"{full_year}-01-01"
+                return f"{year}-01-01"
         
         print(f"Error: Could not extract date from URL: {url}")
         return None
@@ -762,6 +1065,7 @@ class TuneCasterCompleteScraper:
         chart_type = "rock" if "rock" in url else "pop"
         return f"{chart_type}_{chart_id}_{position:03d}"
         
+    @parser_version(1)
     def extract_title_from_cell(self, title_cell):
         link = title_cell.find('a', class_='songLink')
         if link:
@@ -770,6 +1074,7 @@ class TuneCasterCompleteScraper:
         title = title_cell.get_text().strip()
         return re.sub(r'\s+', ' ', title).strip() if title else ""
     
+    @parser_version(1, uses=('extract_artist_from_cell',))
     def find_artist_in_next_tables(self, tables, start_index):
         for j in range(start_index, min(start_index + 20, len(tables))):
             if j >= len(tables):
@@ -817,6 +1122,7 @@ class TuneCasterCompleteScraper:
         
         return ""
     
+    @parser_version(1)
     def extract_artist_from_cell(self, artist_cell):
         artists = []
         
@@ -836,6 +1142,7 @@ class TuneCasterCompleteScraper:
         artist_text = artist_cell.get_text().strip()
         return re.sub(r'\s+', ' ', artist_text).strip() if artist_text else ""
     
+    @parser_version(1)
     def parse_multiple_artists(self, artist_text):
         if not artist_text:
             return []
@@ -877,6 +1184,7 @@ class TuneCasterCompleteScraper:
         
         return [artist_text]
     
+    @parser_version(1, uses=('parse_multiple_artists',))
     def clean_songs(self, songs):
         seen_positions = set()
         unique_songs = []
@@ -905,7 +1213,8 @@ class TuneCasterCompleteScraper:
             unique_songs.append({
                 'position': position,
                 'title': title,
-                'artist': artists
+                'artist': artists,
+                'extractor': song.get('extractor')
             })
             
             seen_positions.add(position)
@@ -913,139 +1222,223 @@ class TuneCasterCompleteScraper:
         return unique_songs
     
     async def scrape_all_charts_sequential(self):
-        print("\nStarting sequential chart scraping...")
-        print("Processing Order: ALL ROCK CHARTS FIRST, THEN ALL POP CHARTS")
-        print("Priority: 2010 charts will be processed first within each category!")
+        print("\nStarting chart scraping (adaptive concurrency)...")
+        order = ', THEN '.join(f"ALL {chart_type.upper()} CHARTS" for chart_type in self.chart_type_order)
+        print(f"Processing Order: {order}")
+        if self.target is None:
+            print("Priority: 2010 charts will be processed first within each category!")
         
         self.load_progress()
         
-        total_charts = len(self.pop_urls) + len(self.rock_urls)
+        urls_by_type = {'rock': self.rock_urls, 'pop': self.pop_urls}
+        total_charts = sum(len(urls_by_type[chart_type]) for chart_type in self.chart_type_order)
         current_chart = 0
         
-        # PHASE 1: Process ALL Rock Charts FIRST
-        print(f"\nPHASE 1: SCRAPING ALL {len(self.rock_urls)} ROCK CHARTS")
-        for i, url in enumerate(self.rock_urls, 1):
+        from group_commit import GroupCommitWriter
+        self.writer = GroupCommitWriter(self, self.commit_batch_size, self.commit_interval).start()
+        try:
+            # One phase per chart type: rock before pop unless a target says otherwise
+            for phase, chart_type in enumerate(self.chart_type_order, 1):
+                urls = urls_by_type[chart_type]
+                print(f"\nPHASE {phase}: SCRAPING ALL {len(urls)} {chart_type.upper()} CHARTS")
+                current_chart = await self.scrape_chart_phase(urls, chart_type, current_chart, total_charts)
+        finally:
+            await self.writer.close()
+            self.writer = None
+    
+    async def scrape_chart_phase(self, urls, chart_type, current_chart, total_charts):
+        import asyncio
+        label = chart_type.capitalize()
+        pending = deque()
+        
+        for i, url in enumerate(urls, 1):
             current_chart += 1
             
-            if url in self.processed_urls:
-                print(f"[{current_chart}/{total_charts}] {i}/{len(self.rock_urls)} - SKIPPED (Rock)")
+            if url in self.processed_urls and not self.refresh:
+                print(f"[{current_chart}/{total_charts}] {i}/{len(urls)} - SKIPPED ({label})")
                 continue
-                
-            # Show if it's a 2010 chart
-            is_2010 = '/charts/10/' in url
-            year_indicator = " [2010]" if is_2010 else ""
-            print(f"[{current_chart}/{total_charts}] {i}/{len(self.rock_urls)} - {url} (Rock){year_indicator}")
-            
-            try:
-                chart_data = await self.scrape_single_chart(url, 'rock')
-                
-                if chart_data:
-                    records_count = len(chart_data['records'])
-                    self.all_chart_data.append(chart_data)
-                    
-                    chart_date = chart_data['chart_info']['chart_date']
-                    chart_type = chart_data['chart_info']['chart_type'].upper()
-                    print(f"Chart Date: {chart_date} | Type: {chart_type}")
-                    
-                    for record in chart_data['records'][:3]:
-                        rank = record['rank']
-                        title = record['title']
-                        artists = json.loads(record['artist'])
-                        if isinstance(artists, list) and artists:
-                            artist_display = ', '.join(artists)
-                        else:
-                            artist_display = '[No Artist]'
-                        print(f"   {rank}. {title} - {artist_display}")
-                    
-                    self.save_progress(url)
-                    self.save_incremental_data()
-                    print(f"Success: {records_count} records")
-                    
-                else:
-                    print("Failed to scrape")
-                    self.save_progress(url)
-            
-            except Exception as e:
-                print(f"Error: {e}")
-                self.save_progress(url)
             
-            await asyncio.sleep(2)
+            pending.append((current_chart, i, url, 0))
         
-        # PHASE 2: Process ALL Pop Charts AFTER Rock Charts
-        print(f"\nPHASE 2: SCRAPING ALL {len(self.pop_urls)} POP CHARTS")
-        for i, url in enumerate(self.pop_urls, 1):
-            current_chart += 1
-            
-            if url in self.processed_urls:
-                print(f"[{current_chart}/{total_charts}] {i}/{len(self.pop_urls)} - SKIPPED (Pop)")
+        tasks = set()
+        while pending or tasks:
+            if not pending:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
                 continue
-                
+            
+            await self.concurrency.acquire()
+            position, i, url, attempt = pending.popleft()
+            
             # Show if it's a 2010 chart
             is_2010 = '/charts/10/' in url
             year_indicator = " [2010]" if is_2010 else ""
-            print(f"[{current_chart}/{total_charts}] {i}/{len(self.pop_urls)} - {url} (Pop){year_indicator}")
+            limit = self.concurrency.current_limit
+            print(f"[{position}/{total_charts}] {i}/{len(urls)} - {url} ({label}){year_indicator} [limit {limit}]")
             
-            try:
-                chart_data = await self.scrape_single_chart(url, 'pop')
-                
-                if chart_data:
-                    records_count = len(chart_data['records'])
-                    self.all_chart_data.append(chart_data)
-                    
-                    chart_date = chart_data['chart_info']['chart_date']
-                    chart_type = chart_data['chart_info']['chart_type'].upper()
-                    print(f"Chart Date: {chart_date} | Type: {chart_type}")
-                    
-                    for record in chart_data['records'][:3]:
-                        rank = record['rank']
-                        title = record['title']
-                        artists = json.loads(record['artist'])
-                        if isinstance(artists, list) and artists:
-                            artist_display = ', '.join(artists)
-                        else:
-                            artist_display = '[No Artist]'
-                        print(f"   {rank}. {title} - {artist_display}")
-                    
-                    self.save_progress(url)
-                    self.save_incremental_data()
-                    print(f"Success: {records_count} records")
-                    
-                else:
-                    print("Failed to scrape")
-                    self.save_progress(url)
+            tasks.add(asyncio.create_task(
+                self.scrape_with_backoff((position, i, url, attempt), chart_type, pending)
+            ))
+        
+        print(f"Concurrency metrics: {self.concurrency.metrics()}")
+        return current_chart
+    
+    async def scrape_with_backoff(self, item, chart_type, pending):
+        import asyncio
+        position, i, url, attempt = item
+        outcome = {}
+        started = time.perf_counter()
+        try:
+            chart_data = await self.scrape_single_chart(url, chart_type, outcome)
+        except Exception as e:
+            outcome['error'] = e.__class__.__name__
+            print(f"Error: {e}")
+            chart_data = None
+        latency = time.perf_counter() - started
+        
+        # The slot is held until the result is handed over: a full writer queue
+        # then stops new fetches instead of piling parsed charts up in memory
+        try:
+            # The politeness delay keeps the slot occupied but is not counted as latency
+            await asyncio.sleep(self.request_delay)
             
+            if (chart_data is None and attempt < self.max_retries and
+                    is_backoff_outcome(outcome.get('status'), outcome.get('error'))):
+                print(f"Retrying later ({attempt + 1}/{self.max_retries}): {url}")
+                pending.append((position, i, url, attempt + 1))
+                return
+            
+            if self.writer is not None:
+                await self.writer.submit(url, chart_data)
+                return
+            try:
+                self.store_chart_result(url, chart_data)
             except Exception as e:
-                print(f"Error: {e}")
-                self.save_progress(url)
+                print(f"Commit failed, left for the next run: {url}: {e}")
+        finally:
+            await self.concurrency.release(
+                latency, outcome.get('status'), outcome.get('error'), outcome.get('retry_after')
+            )
+    
+    async def process_chart_url(self, url, chart_type):
+        try:
+            chart_data = await self.scrape_single_chart(url, chart_type)
+        except Exception as e:
+            print(f"Error: {e}")
+            self.save_progress(url)
+            return None
+        try:
+            self.store_chart_result(url, chart_data)
+        except Exception as e:
+            print(f"Commit failed, left for the next run: {url}: {e}")
+            return None
+        return chart_data
+    
+    def store_chart_result(self, url, chart_data):
+        self.commit_batch([(url, chart_data)])
+    
+    def commit_batch(self, batch):
+        # Group commit: every changed chart's rows are appended and synced, the
+        # date log, digests, search index, NDJSON and aggregates are updated,
+        # and only then does one atomic journal rewrite mark the whole batch
+        # processed together with the new data file size. A crash before the
+        # journal rewrite re-scrapes the batch; the stores replace a chart's
+        # old rows and the date log's latest line per URL wins
+        if self.fetch_only:
+            raise RuntimeError("A fetch-only scraper cannot commit charts")
+        from chart_digests import chart_digest
+        changed = []
+        for url, chart_data in batch:
+            if not chart_data:
+                print(f"Failed to scrape: {url}")
+                continue
+            digest = chart_digest(chart_data)
+            # A digest of a URL the journal does not have yet may come from a
+            # batch whose rows were rolled back, so only committed URLs are skipped
+            if url in self.processed_urls and self.digests.is_unchanged(url, digest):
+                self.unchanged_charts += 1
+                print(f"Unchanged: {len(chart_data['records'])} records, nothing written")
+                continue
+            changed.append((url, chart_data, digest))
+            
+            chart_date = chart_data['chart_info']['chart_date']
+            chart_type = chart_data['chart_info']['chart_type'].upper()
+            print(f"Chart Date: {chart_date} | Type: {chart_type}")
             
-            await asyncio.sleep(2)
+            for record in chart_data['records'][:3]:
+                rank = record['rank']
+                title = record['title']
+                artists = json.loads(record['artist'])
+                if isinstance(artists, list) and artists:
+                    artist_display = ', '.join(artists)
+                else:
+                    artist_display = '[No Artist]'
+                print(f"   {rank}. {title} - {artist_display}")
+        
+        if changed:
+            self.all_chart_data.extend(chart_data for _, chart_data, _ in changed)
+            try:
+                self.save_incremental_data([chart_data for _, chart_data, _ in changed])
+            except Exception:
+                # The rows did not reach the disk: nothing else is updated and
+                # the batch is not journaled, so it is scraped again next run
+                del self.all_chart_data[-len(changed):]
+                raise
+        # Unchanged charts are logged too: a re-scrape may have found the date
+        # on the page where the stored copy had a rule date
+        scraped = [chart_data for _, chart_data in batch if chart_data]
+        if scraped:
+            from chart_calendar import record_dates
+            record_dates(scraped, self.date_log_file)
+        
+        new_urls = [url for url, _ in batch if url not in self.processed_urls]
+        if not changed and not new_urls:
+            return
+        
+        for url, chart_data, digest in changed:
+            self.digests.record(url, digest, chart_data)
+            self.search_index.add_chart(chart_data)
+            if self.ndjson_sink:
+                self.ndjson_sink.write(chart_data)
+            print(f"Success: {len(chart_data['records'])} records")
+        if changed:
+            # One transaction for the group; only the songs and artists it touches are recomputed
+            self.aggregates.add_charts([chart_data for _, chart_data, _ in changed])
+        
+        self.processed_urls.update(url for url, _ in batch)
+        self.write_progress(batch[-1][0])
     
-    def save_incremental_data(self):
+    def save_incremental_data(self, charts=None):
+        if charts is None:
+            charts = self.all_chart_data[-1:]
+        filename = self.data_file
+        file_exists = os.path.exists(filename)
+        start = os.path.getsize(filename) if file_exists else 0
         try:
-            os.makedirs('data', exist_ok=True)
-            filename = 'data/charts_data.csv'
-            file_exists = os.path.exists(filename)
+            os.makedirs(self.data_dir, exist_ok=True)
             
             import csv
+            from chart_streams import format_credits
             mode = 'a' if file_exists else 'w'
             with open(filename, mode, encoding='utf-8', newline='') as f:
                 writer = csv.writer(f)
                 if not file_exists:
                     writer.writerow(['chart_date', 'chart_type', 'rank', 'title', 'artist', 'url'])
                 
-                for chart in self.all_chart_data[-1:]:
+                for chart in charts:
                     chart_type = chart['chart_info']['chart_type']
                     for record in chart['records']:
                         artists = json.loads(record['artist']) if isinstance(record['artist'], str) else record['artist']
-                        artist_str = ', '.join(artists) if artists else ''
                         writer.writerow([
                             record['chart_date'],
                             chart_type,
                             record['rank'],
                             record['title'],
-                            artist_str,
+                            format_credits(artists or []),
                             record['url']
                         ])
+                f.flush()
+                os.fsync(f.fileno())
+                self.data_offset = f.tell()
             
             total_charts = len(self.all_chart_data)
             total_records = sum(len(chart.get('records', [])) for chart in self.all_chart_data)
@@ -1056,10 +1449,20 @@ class TuneCasterCompleteScraper:
             
         except Exception as e:
             print(f"Save failed: {e}")
+            # Cut any partial rows, so the next group appends after committed data
+            try:
+                with open(filename, 'r+b') as f:
+                    f.truncate(start)
+            except OSError:
+                pass
+            raise
     
     def print_final_summary(self):
         if not self.all_chart_data:
-            print("No data to summarize")
+            if self.unchanged_charts:
+                print(f"No changed charts ({self.unchanged_charts} unchanged)")
+            else:
+                print("No data to summarize")
             return
         
         pop_count = len([c for c in self.all_chart_data if c['chart_info']['chart_type'] == 'pop'])
@@ -1077,26 +1480,93 @@ class TuneCasterCompleteScraper:
         print(f"Total Charts: {len(self.all_chart_data)}")
         print(f"Total 2010 Charts: {pop_2010_count + rock_2010_count}")
         print(f"Total Records: {total_records}")
-        print(f"Data File: data/charts_data.csv")
-        print(f"Progress File: data/scraper_progress.json")
+        print(f"Unchanged Charts Skipped: {self.unchanged_charts}")
+        print(f"Data File: {self.data_file}")
+        print(f"Progress File: {self.progress_file}")
+        print(f"Concurrency Limit: {self.concurrency.current_limit} (max {self.concurrency.max_limit})")
         print("="*60)
-        print("PROCESSING ORDER WAS: ALL ROCK FIRST, THEN ALL POP")
+        order = ', THEN '.join(f"ALL {chart_type.upper()}" for chart_type in self.chart_type_order)
+        print(f"PROCESSING ORDER WAS: {order}")
         print("="*60)
 
-async def main():
-    scraper = TuneCasterCompleteScraper()
+
+async def main(args=None):
+    if args is None:
+        args = parse_args([])
+    if args.merge_shards:
+        from crawl_leases import merge_shards
+        merge_shards(args.shard_dir, 'data/charts_data_merged.json', 'data/charts_data_merged.csv')
+        return
+    
+    scraper = TuneCasterCompleteScraper(max_concurrency=args.max_concurrency)
+    scraper.verify_dates = args.verify_dates
+    scraper.refresh = args.refresh or bool(args.urls_from)
+    scraper.commit_batch_size = args.commit_batch
+    scraper.stream_pages = args.stream
+    scraper.commit_interval = args.commit_interval
+    scraper.use_trace = not args.no_trace
+    if args.ndjson:
+        from chart_streams import NDJSONSink
+        scraper.ndjson_sink = NDJSONSink(args.ndjson, append=True)
+        if args.ndjson == '-':
+            # stdout carries the chart stream; progress output moves to stderr
+            sys.stdout = sys.stderr
+    target = build_target(args)
+    profiler = None
+    if args.profile:
+        from crawl_profiler import CrawlProfiler
+        profiler = CrawlProfiler(args.profile_report).attach(scraper)
+        await profiler.start()
     
     print("TuneCaster Complete Scraper")
-    print("ROCK FIRST, THEN POP (2010 Priority)")
+    if target is None:
+        print("ROCK FIRST, THEN POP (2010 Priority)")
     print("="*60)
     
+    lease_store = None
     try:
-        await scraper.discover_all_chart_urls()
+        if args.lease_store:
+            from crawl_leases import LeasedCrawl, open_lease_store
+            lease_store = open_lease_store(args.lease_store)
+        # Nodes joining an already seeded lease store skip URL discovery
+        seeded = lease_store is not None and target is None and any(lease_store.counts().values())
+        
+        if seeded:
+            print(f"Lease store already seeded: {lease_store.counts()}")
+        elif args.urls_from:
+            with open(args.urls_from, 'r', encoding='utf-8') as f:
+                scraper.apply_urls(line.strip() for line in f if line.strip())
+        elif args.probe or args.probe_only:
+            if not args.probe_only:
+                await scraper.discover_all_chart_urls()
+            await scraper.probe_chart_urls(target)
+            if target is not None:
+                scraper.apply_target(target, discovered=True)
+        elif target is None:
+            await scraper.discover_all_chart_urls()
+        elif args.discover:
+            await scraper.discover_all_chart_urls()
+            scraper.apply_target(target, discovered=True)
+        else:
+            scraper.apply_target(target)
         
-        if not scraper.pop_urls and not scraper.rock_urls:
+        if not seeded and not scraper.pop_urls and not scraper.rock_urls:
             print("No chart URLs found. Exiting.")
             return
         
+        if lease_store is not None:
+            crawl = LeasedCrawl(scraper, lease_store, args.node_id, args.shard_dir,
+                                args.lease_batch, args.lease_seconds)
+            crawl.seed()
+            await crawl.run()
+            print("Run with --merge-shards once all nodes are finished")
+            return
+        
+        if args.workers > 1:
+            from multiprocess_crawler import CrawlSupervisor
+            CrawlSupervisor(scraper, args.workers, args.max_rps).run()
+            return
+        
         await scraper.scrape_all_charts_sequential()
         scraper.print_final_summary()
         
@@ -1112,6 +1582,62 @@ async def main():
         print(f"Error: {e}")
         if scraper.all_chart_data:
             scraper.print_final_summary()
+    
+    finally:
+        if lease_store is not None:
+            lease_store.close()
+        if scraper.ndjson_sink:
+            scraper.ndjson_sink.close()
+        scraper.close()
+        if profiler:
+            await profiler.finish()
+
+
+def reparse_pages(args, base_url='https://tunecaster.com'):
+    from chart_streams import NDJSONSink
+    sink = NDJSONSink(args.ndjson) if args.ndjson else None
+    if args.ndjson == '-':
+        sys.stdout = sys.stderr
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.html'))
+        else:
+            paths.append(path)
+
+    scraper = TuneCasterCompleteScraper(base_url=base_url)
+    scraper.use_parse_cache = not args.no_parse_cache
+    parsed = failed = 0
+    try:
+        for path in sorted(paths):
+            chart = parse_chart_url(path.replace(os.sep, '/'))
+            if not chart:
+                print(f"Not a chart page name: {path}")
+                continue
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                html_content = f.read()
+            url = chart_url(base_url, *chart)
+            chart_data = scraper.parse_chart(html_content, url, chart[0])
+            if not chart_data or not chart_data['records']:
+                failed += 1
+                print(f"{path}: no records")
+                continue
+            parsed += 1
+            print(f"{path}: {len(chart_data['records'])} records, {chart_data['chart_info']['chart_date']} "
+                  f"({chart_data['chart_info']['date_source']})")
+            if sink:
+                sink.write(chart_data)
+    finally:
+        if sink:
+            sink.close()
+        scraper.close()
+    print(f"Reparsed {parsed} pages, {failed} without records")
+    if scraper.parse_cache is not None:
+        print(f"Parse cache: {scraper.parse_cache.stats['hits']} hits, {scraper.parse_cache.stats['misses']} misses")
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    from tunecaster_cli import parse_args, run_command
+    run_command(parse_args())
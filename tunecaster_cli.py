@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import sys
+import time
+from crawl_targets import CrawlTarget, chart_url, full_year, parse_chart_url
+# Command line of tunecaster_charts_scraper.py. The scraper itself is only
+# imported for crawl and reparse, so status and query start without it
+
+COMMANDS = ('crawl', 'status', 'validate', 'reparse', 'export', 'query')
+
+
+def add_target_arguments(parser):
+    parser.add_argument('--from', dest='start_date', default=None,
+                        help="First chart date (YYYY, YYYY-MM or YYYY-MM-DD)")
+    parser.add_argument('--to', dest='end_date', default=None,
+                        help="Last chart date (YYYY, YYYY-MM or YYYY-MM-DD)")
+    parser.add_argument('--decades', default=None,
+                        help="Comma separated decades, e.g. 1980s,2000s or 80,00")
+    parser.add_argument('--chart-types', default=None,
+                        help="Comma separated chart types in processing order, e.g. pop,rock")
+
+
+def add_crawl_arguments(parser):
+    add_target_arguments(parser)
+    parser.add_argument('--discover', action='store_true',
+                        help="Filter the index page links instead of computing URLs from YYWW codes")
+    parser.add_argument('--probe', action='store_true',
+                        help="Also check every YYWW URL of the selected years and merge the hits with the index page links")
+    parser.add_argument('--probe-only', action='store_true',
+                        help="Like --probe, without loading the index pages")
+    parser.add_argument('--urls-from', default=None,
+                        help="Crawl exactly the chart URLs listed in this file (implies --refresh)")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Re-scrape charts already processed; only charts whose content changed are written")
+    parser.add_argument('--verify-dates', action='store_true',
+                        help="Also scan each page for its date and report disagreements with the chart calendar")
+    parser.add_argument('--max-concurrency', type=int, default=4,
+                        help="Upper bound for the adaptive number of parallel page loads")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Run N worker processes, each with its own browser, plus one writer process")
+    parser.add_argument('--max-rps', type=float, default=2.0,
+                        help="Politeness limit in requests per second across all worker processes")
+    parser.add_argument('--lease-store', default=None,
+                        help="Shared work store for multi-node crawls: sqlite:PATH or dir:PATH")
+    parser.add_argument('--node-id', default=None,
+                        help="Name of this node in the lease store (default: hostname-pid)")
+    parser.add_argument('--lease-batch', type=int, default=20,
+                        help="Charts claimed per lease")
+    parser.add_argument('--lease-seconds', type=int, default=600,
+                        help="Lease duration before unfinished charts can be reclaimed")
+    parser.add_argument('--shard-dir', default='data/shards',
+                        help="Where each node writes its results")
+    parser.add_argument('--merge-shards', action='store_true',
+                        help="Merge all node results into data/charts_data_merged.json and exit")
+    parser.add_argument('--stream', action='store_true',
+                        help="Fetch chart pages over plain HTTP and parse them while they download; "
+                             "pages that do not parse are loaded in the browser")
+    parser.add_argument('--commit-batch', type=int, default=25,
+                        help="Charts per group commit of the data file and progress journal")
+    parser.add_argument('--commit-interval', type=float, default=2.0,
+                        help="Longest a finished chart waits for its group commit, in seconds")
+    parser.add_argument('--ndjson', default=None,
+                        help="Also write each stored chart as one JSON line to this file (.gz ok, - for stdout)")
+    parser.add_argument('--no-trace', action='store_true',
+                        help="Do not write the per-page crawl trace to data/traces")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile parse functions, memory growth and event loop lag")
+    parser.add_argument('--profile-report', default='data/profile_report.txt',
+                        help="Where --profile writes its report")
+
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Bare options mean crawl, as they did before there were subcommands
+    if not argv or argv[0] not in COMMANDS + ('-h', '--help'):
+        argv.insert(0, 'crawl')
+
+    parser = argparse.ArgumentParser(description="TuneCaster pop and rock chart scraper")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add_crawl_arguments(subparsers.add_parser('crawl', help="Discover and scrape charts (default)"))
+
+    status = subparsers.add_parser('status', help="Show progress, record counts and missing weeks")
+    add_target_arguments(status)
+    status.add_argument('--list-missing', action='store_true', help="Print the URL of every missing chart")
+
+    validate = subparsers.add_parser('validate', help="Check collected charts and write the re-scrape list")
+    validate.add_argument('sources', nargs='*', help="Rebuild the binary store from these files first")
+    validate.add_argument('--output', default='data/rescrape_urls.txt')
+    validate.add_argument('--skip', default='', help="Comma separated checks to ignore, e.g. length,spacing")
+
+    reparse = subparsers.add_parser('reparse', help="Run the parser over saved chart pages")
+    reparse.add_argument('paths', nargs='+', help="Saved .html chart pages or directories of them")
+    reparse.add_argument('--ndjson', default=None, help="Write the parsed charts here (.gz ok, - for stdout)")
+    reparse.add_argument('--no-parse-cache', action='store_true',
+                         help="Run the extractors on every page instead of reusing cached outputs")
+
+    export = subparsers.add_parser('export', help="Convert collected charts to NDJSON, CSV or the binary store")
+    export.add_argument('sources', nargs='*', help="Chart data files (default: data/charts_data.csv or .json)")
+    export.add_argument('--format', choices=['ndjson', 'csv', 'binary'], default='ndjson')
+    export.add_argument('--output', default=None, help="Output path (default: stdout, or data/charts_bin)")
+
+    query = subparsers.add_parser('query', help="Fuzzy title and artist search")
+    query.add_argument('text')
+    query.add_argument('--field', choices=['title', 'artist'], default=None)
+    query.add_argument('--chart-type', default=None)
+    query.add_argument('--min-score', type=float, default=0.45)
+    query.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args(argv)
+    if args.command == 'crawl' and args.workers > 1 and args.profile:
+        parser.error("--profile measures the in-process crawl and cannot be combined with --workers")
+    return args
+
+
+def build_target(args):
+    if not (args.start_date or args.end_date or args.decades or args.chart_types):
+        return None
+    split = lambda value: [part.strip() for part in value.split(',') if part.strip()] if value else None
+    from chart_calendar import ChartCalendar
+    calendar = ChartCalendar.load()
+    return CrawlTarget(args.start_date, args.end_date, split(args.decades), split(args.chart_types),
+                       week_dates=calendar.week_dates if calendar else None)
+
+
+def show_status(args, data_dir='data', base_url='https://tunecaster.com'):
+    progress_file = os.path.join(data_dir, 'scraper_progress.json')
+    progress = {}
+    if os.path.exists(progress_file):
+        with open(progress_file, 'r', encoding='utf-8') as f:
+            progress = json.load(f)
+    processed = progress.get('processed_urls', [])
+    print(f"Processed charts: {len(processed)}")
+    if progress.get('last_processed'):
+        print(f"Last processed: {progress['last_processed']} at {progress.get('timestamp')}")
+
+    data_file = os.path.join(data_dir, 'charts_data.csv')
+    if os.path.exists(data_file):
+        lines = 0
+        with open(data_file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                lines += block.count(b'\n')
+        print(f"Records in {data_file}: {max(lines - 1, 0)} ({os.path.getsize(data_file) / 1e6:.1f} MB)")
+    else:
+        print(f"No data file yet ({data_file})")
+
+    target = build_target(args)
+    if target is None:
+        from chart_calendar import ChartCalendar
+        calendar = ChartCalendar.load()
+        target = CrawlTarget(week_dates=calendar.week_dates if calendar else None)
+    done = {parse_chart_url(url) for url in processed}
+    missing = [(chart_type, code) for chart_type, codes in target.codes.items()
+               for code in codes if (chart_type, code) not in done]
+    print(f"Missing weeks: {len(missing)} of {len(target)} ({target.describe()})")
+
+    by_year = {}
+    for chart_type, code in missing:
+        key = (chart_type, full_year(int(code[:2])))
+        by_year[key] = by_year.get(key, 0) + 1
+    for (chart_type, year), count in sorted(by_year.items()):
+        print(f"  {chart_type:<5} {year}: {count} missing")
+    if args.list_missing:
+        for chart_type, code in missing:
+            print(chart_url(base_url, chart_type, code))
+
+
+def export_data(args):
+    sources = args.sources or [next((p for p in ['data/charts_data.csv', 'data/charts_data.json'] if os.path.exists(p)),
+                                    'data/charts_data.csv')]
+    if args.format == 'binary':
+        from binary_store import STORE_DIR, build_store
+        meta = build_store(sources, args.output or STORE_DIR)
+        print(f"Exported {meta['charts']} charts, {meta['records']} records to {args.output or STORE_DIR}")
+        return
+
+    from chart_digests import read_charts
+    from chart_streams import CSVSink, NDJSONSink
+    output = args.output or '-'
+    sink = NDJSONSink(output) if args.format == 'ndjson' else CSVSink(output)
+    try:
+        for path in sources:
+            for chart in read_charts(path):
+                sink.write(chart)
+    finally:
+        sink.close()
+    print(f"Exported {sink.charts} charts to {output}", file=sys.stderr)
+
+
+def query_index(args):
+    from search_index import INDEX_FILE, SearchIndex, format_hit
+    if not os.path.exists(INDEX_FILE):
+        # Opening the index would create an empty one
+        print(f"No search index yet ({INDEX_FILE}); it is built as charts are stored")
+        return
+    index = SearchIndex()
+    try:
+        started = time.perf_counter()
+        hits = index.search(args.text, args.field, args.chart_type, args.min_score, args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+    finally:
+        index.close()
+    for hit in hits:
+        print(format_hit(hit))
+    print(f"{len(hits)} hits in {elapsed:.1f} ms")
+
+
+def run_command(args):
+    if args.command == 'crawl':
+        import asyncio
+        from tunecaster_charts_scraper import main
+        asyncio.run(main(args))
+    elif args.command == 'status':
+        show_status(args)
+    elif args.command == 'validate':
+        from chart_validator import run_validation
+        run_validation(args.sources, output=args.output, skip=args.skip)
+    elif args.command == 'reparse':
+        from tunecaster_charts_scraper import reparse_pages
+        reparse_pages(args)
+    elif args.command == 'export':
+        export_data(args)
+    else:
+        query_index(args)
+
+
+if __name__ == "__main__":
+    run_command(parse_args())
@@ -0,0 +1,148 @@
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from datetime import date, datetime, timedelta
+
+from concurrency_control import is_backoff_outcome
+from crawl_targets import chart_url
+
+PROBE_FILE = 'data/url_probes.jsonl'
+# Candidate week numbers per year: 52 or 53 Saturdays, whatever a year has
+MAX_WEEK = 53
+
+
+def candidate_urls(base_url, chart_type, years, today=None):
+    # The arithmetic URL space: every YYWW code of the given years whose
+    # Saturday has already passed, linked from an index page or not
+    today = today or date.today()
+    urls = []
+    for year in years:
+        first_saturday = date(year, 1, 1) + timedelta(days=(5 - date(year, 1, 1).weekday()) % 7)
+        for week in range(1, MAX_WEEK + 1):
+            if first_saturday + timedelta(weeks=week - 1) > today:
+                break
+            urls.append(chart_url(base_url, chart_type, f"{year % 100:02d}{week:02d}"))
+    return urls
+
+
+def probe_request(url, user_agent, timeout=15):
+    # Returns (status, retry_after). HEAD first; servers that refuse it get a
+    # GET whose body is never read. A redirect to another page (the site's
+    # home page for unknown charts) counts as missing
+    for method in ('HEAD', 'GET'):
+        request = urllib.request.Request(url, method=method, headers={'User-Agent': user_agent})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if response.geturl() != url:
+                    return 404, None
+                return response.status, None
+        except urllib.error.HTTPError as e:
+            if method == 'HEAD' and e.code in (405, 501):
+                continue
+            return e.code, e.headers.get('Retry-After')
+    return None, None
+
+
+class ProbeLog:
+    # Append-only JSONL of probe results; the latest line per URL wins. Known
+    # misses are not probed again and known hits need no request at all
+
+    def __init__(self, path=PROBE_FILE):
+        self.path = path
+        self.results = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.results[entry['url']] = entry['exists']
+        except Exception as e:
+            print(f"Could not load URL probes: {e}")
+
+    def known(self, url):
+        return self.results.get(url)
+
+    def record(self, url, exists, status):
+        if self.results.get(url) == exists:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'url': url, 'exists': exists, 'status': status,
+                                'checked_at': datetime.now().isoformat()}) + '\n')
+        self.results[url] = exists
+
+
+class URLProber:
+    # Checks candidate URLs with concurrent lightweight requests under the
+    # crawl's AIMD controller, so probes back off on 429/5xx and honour
+    # Retry-After exactly like page loads. Throttled probes are retried;
+    # only definite answers are written to the probe log
+
+    def __init__(self, concurrency, log, user_agent, delay=0.5, max_retries=3):
+        self.concurrency = concurrency
+        self.log = log
+        self.user_agent = user_agent
+        self.delay = delay
+        self.max_retries = max_retries
+        self.stats = {'probed': 0, 'found': 0, 'missing': 0, 'known_hits': 0, 'known_misses': 0, 'unresolved': 0}
+
+    async def probe(self, urls):
+        import asyncio
+        found = []
+        pending = deque()
+        for url in urls:
+            known = self.log.known(url)
+            if known is True:
+                self.stats['known_hits'] += 1
+                found.append(url)
+            elif known is False:
+                self.stats['known_misses'] += 1
+            else:
+                pending.append((url, 0))
+
+        tasks = set()
+        while pending or tasks:
+            if not pending:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            await self.concurrency.acquire()
+            tasks.add(asyncio.create_task(self.probe_one(*pending.popleft(), pending, found)))
+        return found
+
+    async def probe_one(self, url, attempt, pending, found):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        status, retry_after, error = None, None, None
+        started = time.perf_counter()
+        try:
+            status, retry_after = await loop.run_in_executor(None, probe_request, url, self.user_agent)
+        except Exception as e:
+            error = 'TimeoutError' if isinstance(getattr(e, 'reason', e), TimeoutError) else e.__class__.__name__
+        latency = time.perf_counter() - started
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            await self.concurrency.release(latency, status, error, retry_after)
+
+        self.stats['probed'] += 1
+        if is_backoff_outcome(status, error) or error:
+            if attempt < self.max_retries:
+                pending.append((url, attempt + 1))
+            else:
+                self.stats['unresolved'] += 1
+            return
+        exists = status is not None and status < 400
+        self.log.record(url, exists, status)
+        if exists:
+            self.stats['found'] += 1
+            found.append(url)
+        else:
+            self.stats['missing'] += 1